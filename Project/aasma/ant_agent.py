@@ -1,14 +1,49 @@
+import functools
 import math
-import random
 import numpy as np
 from scipy.spatial.distance import cityblock
 from abc import ABC, abstractmethod
 
 N_ACTIONS = 12
+RANDOM_BATCH_SIZE = 256 # uniform draws taken from the generator at once
 DOWN, LEFT, UP, RIGHT, STAY, DOWN_PHERO, LEFT_PHERO, UP_PHERO, RIGHT_PHERO, COLLECT_FOOD, DROP_FOOD, COLLECT_FOOD_FROM_ANT = range(N_ACTIONS)
 
+class ViewTables:
+
+    """Lookup tables of a (2 * radius + 1) x (2 * radius + 1) view, whose cells are numbered row by row from the top-left one
+    offsets[index] is the (column, row) offset of a cell from the agent, the other attributes are the index steps to the
+    neighbouring cells and where each part of the observation lies (for a single colony)
+    """
+
+    def __init__(self, radius):
+        # The agents look at the cells next to their neighbours, which need to be in the view
+        assert radius >= 2, f"View radius {radius} too small, the agents need at least 2."
+        self.radius = radius
+        self.side = 2 * radius + 1
+        self.n_cells = self.side ** 2
+        self.center = self.n_cells // 2 # the agent itself
+
+        rows, columns = np.divmod(np.arange(self.n_cells), self.side)
+        self.offsets = np.stack((columns - radius, rows - radius), axis=1)
+
+        # Index steps to the cell below, left, above and right of another, and the indices of the cells next to the agent
+        self.down, self.left, self.up, self.right = self.side, -1, -self.side, 1
+        self.neighbours = tuple(self.center + step for step in (self.down, self.left, self.up, self.right))
+
+        # Observation layout: agent pos (2), colony pos (2), foodpiles, pheromones, colony storage (1), has food (1), other agents
+        self.foodpiles = slice(4, 4 + self.n_cells)
+        self.pheromones = slice(4 + self.n_cells, 4 + 2 * self.n_cells)
+        self.colony_storage = 4 + 2 * self.n_cells
+        self.has_food = 5 + 2 * self.n_cells
+        self.other_agents = slice(6 + 2 * self.n_cells, None)
+        self.observation_size = 6 + 3 * self.n_cells
+
+@functools.lru_cache(maxsize=None)
+def view_tables(radius):
+    return ViewTables(radius) # built once per radius, shared by every agent
+
 class AntAgent(ABC):
-    def __init__(self, name: str, agent_id, n_agents, knowledgeable):
+    def __init__(self, name: str, agent_id, n_agents, knowledgeable, view_radius=2):
         self.name = name
         self.observation :np.ndarray = np.ndarray([])
         self.agent_id = agent_id
@@ -16,6 +51,8 @@ class AntAgent(ABC):
         self.n_actions = N_ACTIONS
         self.knowledgeable = knowledgeable
         self.steps_carrying_food = 0 
+        self.view = view_tables(view_radius) # has to match the env's view_radius (checked on the first observation)
+        self._view_checked = False
 
         # Exploration variables
         self.steps_exploring = 0
@@ -23,7 +60,20 @@ class AntAgent(ABC):
         self.following_trail = False
         self.promising_pheromone_pos = None
 
+        self.seed()
+
+    def seed(self, n=None):
+        # Every random decision of the agent comes from this generator (n can also be a numpy SeedSequence)
+        self.np_random = np.random.default_rng(n)
+        self._random_batch = np.empty(0)
+        self._random_batch_i = 0
+
     def see(self, observation: np.ndarray):
+        if not self._view_checked:
+            if len(observation) != self.view.observation_size:
+                raise ValueError(f"Observation of size {len(observation)} does not match the agent's view radius {self.view.radius} "
+                                 f"(size {self.view.observation_size}), the agent and the env need the same view_radius.")
+            self._view_checked = True
         self.observation = observation
 
     @abstractmethod
@@ -36,40 +86,27 @@ class AntAgent(ABC):
 
     def find_global_pos(self, agent_pos, object_relative_position_index):
         
-        # Test: 23, agent is 4,6
-
-        # Calculate relative row and global row
-        if(object_relative_position_index <= 4):
-            relative_row = 0 
-            global_row = agent_pos[1] - 2
-        elif(object_relative_position_index > 4 and object_relative_position_index <= 9):
-            relative_row = 1 
-            global_row = agent_pos[1] - 1
-        elif(object_relative_position_index > 9 and object_relative_position_index <= 14):
-             relative_row = 2
-             global_row = agent_pos[1]
-        elif(object_relative_position_index > 14 and object_relative_position_index <= 19):
-            relative_row = 3
-            global_row = agent_pos[1] + 1
-        elif(object_relative_position_index > 19 and object_relative_position_index <= 24):
-            relative_row = 4
-            global_row = agent_pos[1] + 2
-        # row = 8 -> Correct, relative row is 4
-
-        # Calculate relative column and global column
-        relative_column = object_relative_position_index - 5 * relative_row
-        global_column = agent_pos[0] + (relative_column - 2)  # column = 5
-
-        global_pos = np.array([global_column, global_row]) # 5, 8
+        # Test: 23, agent is 4,6 -> 5,8
+
+        if(object_relative_position_index >= 0):
+            offset = self.view.offsets[object_relative_position_index]
+        else: # indices before the view are read as if on its first row
+            offset = (object_relative_position_index - self.view.radius, -self.view.radius)
+
+        global_pos = np.array([agent_pos[0] + offset[0], agent_pos[1] + offset[1]])
  
         return global_pos
     
+    def find_global_positions(self, agent_pos, objects_relative_position_indices):
+        # Global positions of several view cells at once (indices from np.where), flattened as [x1 y1 x2 y2 ...]
+        return (np.asarray(agent_pos, dtype=float) + self.view.offsets[objects_relative_position_indices]).reshape(-1)
+
     def find_relative_index(self, agent_pos, object_global_position):
         
         # Test: Agent is [4 6] ; Object is [5 8] -> 23
 
         distances = np.array(object_global_position) - np.array(agent_pos) # [5 8] - [4 6] = [1 2]
-        object_relative_position_index = 12 + distances[0] * 1 + distances[1] * 5 # 23
+        object_relative_position_index = self.view.center + distances[0] * self.view.right + distances[1] * self.view.down # 23
  
         return int(object_relative_position_index)
 
@@ -85,7 +122,7 @@ class AntAgent(ABC):
         elif abs_distances[0] < abs_distances[1]:
             return self._close_vertically(distances, has_food)
         else:
-            roll = random.uniform(0, 1)
+            roll = self.random_uniform()
             return self._close_horizontally(distances, has_food) if roll > 0.5 else self._close_vertically(distances, has_food)
         
     def closest_point_of_interest(self, agent_position, points_of_interest):
@@ -112,12 +149,12 @@ class AntAgent(ABC):
         """ 
 
         # Find the global positions of the surrounding pheromones
-        surrounding_pheromone_down_pos = self.find_global_pos(agent_position, promising_pheromone_relative_index + 5)
-        surrounding_pheromone_left_pos = self.find_global_pos(agent_position, promising_pheromone_relative_index - 1)
-        surrounding_pheromone_up_pos = self.find_global_pos(agent_position, promising_pheromone_relative_index - 5)
-        surrounding_pheromone_right_pos = self.find_global_pos(agent_position, promising_pheromone_relative_index + 1)
+        indices = promising_pheromone_relative_index + np.array([self.view.down, self.view.left, self.view.up, self.view.right])
 
-        indices = np.array([promising_pheromone_relative_index + 5, promising_pheromone_relative_index - 1, promising_pheromone_relative_index - 5, promising_pheromone_relative_index + 1])
+        surrounding_pheromone_down_pos = self.find_global_pos(agent_position, indices[0])
+        surrounding_pheromone_left_pos = self.find_global_pos(agent_position, indices[1])
+        surrounding_pheromone_up_pos = self.find_global_pos(agent_position, indices[2])
+        surrounding_pheromone_right_pos = self.find_global_pos(agent_position, indices[3])
 
         pos1 = np.concatenate((surrounding_pheromone_down_pos, surrounding_pheromone_left_pos))
         pos2 = np.concatenate((pos1, surrounding_pheromone_up_pos))
@@ -152,7 +189,7 @@ class AntAgent(ABC):
     
     def explore_randomly(self):
         
-        if(any([self.observation[55]])): # if agent has food, lay down pheromones
+        if(any([self.observation[self.view.has_food]])): # if agent has food, lay down pheromones
             index_min = 5
             index_max = 8
         else:
@@ -160,13 +197,13 @@ class AntAgent(ABC):
             index_max = 3
 
         if(self.steps_exploring == 0): # hasn't been exploring -> choose direction and keep it for 5 steps (arbitrary amount)
-            self.current_exploring_action = random.randint(index_min, index_max)
+            self.current_exploring_action = self.random_integer(index_min, index_max)
 
         elif(self.steps_exploring >= 5): # has explored enough in one direction -> choose another which isn't the opposite and isn't the same (better behavior)
                 
-            new_exploring_action = random.randint(index_min, index_max)
+            new_exploring_action = self.random_integer(index_min, index_max)
             while(new_exploring_action == self.current_exploring_action + 2 or new_exploring_action == self.current_exploring_action - 2 or new_exploring_action == self.current_exploring_action):
-                new_exploring_action = random.randint(index_min, index_max)
+                new_exploring_action = self.random_integer(index_min, index_max)
             
             self.current_exploring_action = new_exploring_action
             self.steps_exploring = 0 # this action isn't changed in next call because of the += 1 below
@@ -180,7 +217,7 @@ class AntAgent(ABC):
     
     def check_for_other_ants_in_view(self, other_agents_in_view):
         other_agents_in_view_copy = other_agents_in_view.copy()
-        other_agents_in_view_copy[12] = 0 # remove the agent itself from the list of other agents in view
+        other_agents_in_view_copy[self.view.center] = 0 # remove the agent itself from the list of other agents in view
         others_indexes = np.where(other_agents_in_view_copy == 2)[0]
         return any(others_indexes) # if there are any other_ants_in_view
         
@@ -193,13 +230,7 @@ class AntAgent(ABC):
         foodpiles_indices = np.where(foodpiles_in_view != 0)[0] # gather for non null indices
 
         # Get corresponding positions in array format
-        foodpiles_positions = np.zeros(len(foodpiles_indices) * 2)
-
-
-        for foodpile_i in range(len(foodpiles_indices)): 
-            foodpile_i_pos = self.find_global_pos(agent_position, foodpiles_indices[foodpile_i])
-            foodpiles_positions[foodpile_i * 2] = foodpile_i_pos[0]
-            foodpiles_positions[foodpile_i * 2 + 1] = foodpile_i_pos[1]
+        foodpiles_positions = self.find_global_positions(agent_position, foodpiles_indices)
 
         # Check closest foodpile position and move there
         closest_foodpile_position = self.closest_point_of_interest(agent_position, foodpiles_positions)
@@ -208,15 +239,11 @@ class AntAgent(ABC):
     
     def go_to_closest_ant(self, agent_position, other_agents_in_view):
         other_agents_in_view_copy = other_agents_in_view.copy()
-        other_agents_in_view_copy[12] = 0 # remove the agent itself from the list of other agents in view
+        other_agents_in_view_copy[self.view.center] = 0 # remove the agent itself from the list of other agents in view
         ants_indices = np.where( other_agents_in_view_copy == 2)[0] # gather for non null indices
 
         # Get corresponding positions in array format
-        ants_positions = np.zeros(len(ants_indices) * 2)
-        for other_agent_i in range(len(ants_indices)): 
-            other_agent_position_i_pos = self.find_global_pos(agent_position, ants_indices[other_agent_i])
-            ants_positions[other_agent_i * 2] =  other_agent_position_i_pos[0]
-            ants_positions[other_agent_i * 2 + 1] =  other_agent_position_i_pos[1]
+        ants_positions = self.find_global_positions(agent_position, ants_indices)
 
         # Check closest foodpile position and move there
         closest_ant_position = self.closest_point_of_interest(agent_position, ants_positions)
@@ -235,22 +262,24 @@ class AntAgent(ABC):
 
         colony_index = self.find_relative_index(agent_position, colony_position)
 
+        down, left, up, right = self.view.neighbours
+
         # Go around fixed obstacles, like foodpiles and colony
-        if((action == 0 and (foodpiles_in_view[12 + 5] != 0 or colony_index == 12 + 5 or other_agents_in_view[12 + 5] != 0)) or
-            (action == 2 and (foodpiles_in_view[12 - 5] or colony_index == 12 - 5 or other_agents_in_view[12 - 5] != 0))): # foddpile is obstructing up/down
-            action = random.randrange(1, 4, 2) # gives odds (left or right)
+        if((action == 0 and (foodpiles_in_view[down] != 0 or colony_index == down or other_agents_in_view[down] != 0)) or
+            (action == 2 and (foodpiles_in_view[up] or colony_index == up or other_agents_in_view[up] != 0))): # foddpile is obstructing up/down
+            action = self.random_integer(0, 1) * 2 + 1 # gives odds (left or right)
 
-        elif((action == 1 and (foodpiles_in_view[12 - 1] != 0 or colony_index == 12 - 1 or other_agents_in_view[12 - 1] != 0)) or
-             (action == 3 and (foodpiles_in_view[12 + 1] or colony_index == 12 + 1 or other_agents_in_view[12 + 1] != 0))): # object is obstructing left/right
-            action = random.randrange(0, 3, 2) # gives evens (up or down)
+        elif((action == 1 and (foodpiles_in_view[left] != 0 or colony_index == left or other_agents_in_view[left] != 0)) or
+             (action == 3 and (foodpiles_in_view[right] or colony_index == right or other_agents_in_view[right] != 0))): # object is obstructing left/right
+            action = self.random_integer(0, 1) * 2 # gives evens (up or down)
 
-        elif((action == 5 and (foodpiles_in_view[12 + 5] != 0 or colony_index == 12 + 5 or other_agents_in_view[12 + 5] != 0)) or
-             (action == 7 and (foodpiles_in_view[12 - 5] or colony_index == 12 - 5 or other_agents_in_view[12 - 5] != 0))): # object is obstructing up_phero/down_phero
-            action = random.randrange(6, 9, 2) # gives odds (left phero or right phero)
+        elif((action == 5 and (foodpiles_in_view[down] != 0 or colony_index == down or other_agents_in_view[down] != 0)) or
+             (action == 7 and (foodpiles_in_view[up] or colony_index == up or other_agents_in_view[up] != 0))): # object is obstructing up_phero/down_phero
+            action = self.random_integer(0, 1) * 2 + 6 # gives odds (left phero or right phero)
 
-        elif((action == 6 and (foodpiles_in_view[12 - 1] != 0 or colony_index == 12 - 1 or other_agents_in_view[12 - 1] != 0)) or
-              (action == 8 and (foodpiles_in_view[12 + 1] or colony_index == 12 + 1 or other_agents_in_view[12 + 1] != 0))): # object is obstructing left_phero/right_phero
-            action = random.randrange(5, 8, 2) # gives evens (up phero or down phero)
+        elif((action == 6 and (foodpiles_in_view[left] != 0 or colony_index == left or other_agents_in_view[left] != 0)) or
+              (action == 8 and (foodpiles_in_view[right] or colony_index == right or other_agents_in_view[right] != 0))): # object is obstructing left_phero/right_phero
+            action = self.random_integer(0, 1) * 2 + 5 # gives evens (up phero or down phero)
 
         return action
 
@@ -258,14 +287,14 @@ class AntAgent(ABC):
         agent_position = self.observation[:2]
         colony_position = self.observation[2:4] # FOR ONLY 1 COLONY
 
-        foodpiles_in_view = self.observation[4:29]
-        pheromones_in_view = self.observation[29:54]
+        foodpiles_in_view = self.observation[self.view.foodpiles]
+        pheromones_in_view = self.observation[self.view.pheromones]
 
-        colony_storage = self.observation[54] # FOR ONLY 1 COLONY
-        has_food = any([self.observation[55]])
-        food_quantity = self.observation[55]
+        colony_storage = self.observation[self.view.colony_storage] # FOR ONLY 1 COLONY
+        has_food = any([self.observation[self.view.has_food]])
+        food_quantity = self.observation[self.view.has_food]
 
-        other_agents_in_view = self.observation[56:]
+        other_agents_in_view = self.observation[self.view.other_agents]
 
         return agent_position, colony_position, foodpiles_in_view, pheromones_in_view, colony_storage, has_food, food_quantity, other_agents_in_view
 
@@ -279,6 +308,19 @@ class AntAgent(ABC):
 
         return distance
 
+    def random_uniform(self):
+        # Uniform draws are taken from the generator in batches, refilled when used up
+        if self._random_batch_i == len(self._random_batch):
+            self._random_batch = self.np_random.random(RANDOM_BATCH_SIZE)
+            self._random_batch_i = 0
+
+        self._random_batch_i += 1
+        return self._random_batch[self._random_batch_i - 1]
+
+    def random_integer(self, low, high):
+        # Random integer in [low, high] (both included, like random.randint)
+        return low + int(self.random_uniform() * (high - low + 1))
+
     # ############### #
     # Private Methods #
     # ############### #
@@ -0,0 +1,88 @@
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+class ArtifactWriter:
+
+    """Saves images (heat maps, plots) from a small pool of background threads
+    Callers hand over raw uint8 arrays, PNG encoding and file I/O happen off the simulation path (PIL and zlib release the GIL).
+    At most max_pending images wait to be written, further saves block until one is done, so memory stays bounded on slow disks
+    """
+
+    def __init__(self, n_workers=2, max_pending=16):
+        self._executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='artifact_writer')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def save_image(self, array, filename):
+        # The array is copied, so the caller may reuse it right away
+        assert not self.closed, "Writer already closed."
+        array = np.array(array, dtype=np.uint8)
+
+        self._slots.acquire() # back-pressure
+        try:
+            future = self._executor.submit(_save_image, array, filename)
+        except BaseException:
+            self._slots.release() # nothing was queued
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self.__done)
+        return future
+
+    def save_figure(self, figure, filename):
+        # PNG files are rasterized here and encoded in the background, other formats are saved right away by matplotlib
+        if not str(filename).lower().endswith('.png') or not hasattr(figure.canvas, 'buffer_rgba'):
+            figure.savefig(filename)
+            return None
+
+        figure.canvas.draw()
+        return self.save_image(np.asarray(figure.canvas.buffer_rgba()), filename)
+
+    def flush(self):
+        # Wait for every save submitted so far, raising the first error met
+        with self._lock:
+            pending = list(self._pending)
+
+        failed = [future for future in pending if future.exception() is not None]
+        with self._lock:
+            self._pending.difference_update(pending)
+        if failed:
+            raise failed[0].exception()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+            self.closed = True
+
+    def __done(self, future):
+        # Failed saves stay pending, so their error is raised by the next flush
+        self._slots.release()
+        if future.exception() is None:
+            with self._lock:
+                self._pending.discard(future)
+
+
+def _save_image(array, filename):
+    Image.fromarray(array).save(filename)
+
+
+_default_writer = None
+
+def default_writer():
+    # Writer shared by draw_heat_map and the plot helpers, flushed when the interpreter exits
+    global _default_writer
+    if _default_writer is None or _default_writer.closed:
+        _default_writer = ArtifactWriter()
+        atexit.register(_default_writer.close)
+    return _default_writer
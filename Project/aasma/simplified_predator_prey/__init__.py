@@ -1 +1,6 @@
 from aasma.simplified_predator_prey.ant_colony_env import AntColonyEnv
+from aasma.simplified_predator_prey.vec_ant_colony_env import VecAntColonyEnv
+from aasma.simplified_predator_prey.subproc_vec_ant_colony_env import SubprocVecAntColonyEnv
+from aasma.simplified_predator_prey.frame_recorder import FrameRecorder, FrameStore
+from aasma.simplified_predator_prey.action_replay import ActionReplay
+from aasma.simplified_predator_prey.layout_cache import LayoutCache
@@ -0,0 +1,97 @@
+import numpy as np
+
+
+class ActionReplay:
+
+    """Re-simulates a recorded episode of an AntColonyEnv from its seed and its actions alone (no agent is run)
+    Steps skip observation building unless asked for, and a state checkpoint is kept every checkpoint_interval steps,
+    so seeking to any step only simulates the steps since the nearest checkpoint before it
+    """
+
+    def __init__(self, env, seed, actions, checkpoint_interval=100, rewards=None, final_state=None):
+        # env has to be built with the same arguments as the recorded one, actions has one row (of n_agents actions) per step
+        # rewards (one row per step) and final_state (env.get_state() at the end) are what verify checks the replay against
+        self.env = env.unwrapped
+        self.seed = seed
+        self.actions = np.asarray(actions)
+        self.checkpoint_interval = checkpoint_interval
+        self.rewards, self.final_state = rewards, final_state
+
+        # Same start as seed(seed) followed by reset()
+        self.env.seed(seed)
+        self.env._reset_state()
+        self.current_step = 0
+        self.checkpoints = {0: self.env.get_state()}
+
+    @classmethod
+    def from_trajectory_log(cls, env, trajectory_log, episode_i, checkpoint_interval=100):
+        # Replay of an episode logged by a TrajectoryLog with its seed, verified against its logged rewards and final state,
+        # returned with the logged columns
+        seed = trajectory_log.episodes[episode_i]['seed']
+        assert seed is not None, "The episode was logged without its seed."
+        episode = trajectory_log.read_episode(episode_i)
+        return cls(env, seed, episode['actions'], checkpoint_interval, episode['rewards'], episode.get('final_state')), episode
+
+    def __len__(self):
+        return len(self.actions)
+
+    def seek(self, step, observations=False):
+        # Bring the env to its state after the given number of steps, returns the observations of that step if asked
+        assert 0 <= step <= len(self.actions), f"Step {step} out of range (0 to {len(self.actions)})."
+
+        checkpoint = max(checkpoint for checkpoint in self.checkpoints if checkpoint <= step)
+        if step < self.current_step or checkpoint > self.current_step:
+            self.env.set_state(self.checkpoints[checkpoint])
+            self.current_step = checkpoint
+
+        while self.current_step < step:
+            self.__advance()
+
+        return self.observations() if observations else None
+
+    def observations(self):
+        # Observations the agents got at the current step, as returned by reset/step
+        return self.env.format_outgoing_observations(self.env.simplified_features(), self.env.get_agent_obs())
+
+    def frames(self, start=0, stop=None, mode='rgb_array'):
+        # Rendered frames of steps start to stop (inclusive, the end of the episode by default)
+        stop = len(self.actions) if stop is None else stop
+        for step in range(start, stop + 1):
+            self.seek(step)
+            yield self.env.render(mode=mode)
+
+    def verify(self, rewards=None, final_state=None):
+        # Replays the whole episode, returns what does not match the recording (rewards per step and final env.get_state(),
+        # the recorded ones unless given), so an empty list means the replay is faithful
+        rewards = self.rewards if rewards is None else rewards
+        final_state = self.final_state if final_state is None else final_state
+        mismatches = [] if final_state is not None else ["final state (not recorded)"]
+
+        self.seek(0)
+        for step in range(len(self.actions)):
+            step_rewards = self.__advance()
+            if rewards is not None and not np.array_equal(step_rewards, rewards[step]):
+                mismatches.append(f"rewards of step {step + 1}")
+
+        if final_state is not None:
+            state = self.env.get_state()
+            mismatches += [f"final {key}" for key in final_state if not _equal(state[key], final_state[key])]
+
+        return mismatches
+
+    def __advance(self):
+        rewards = self.env._step_state(self.actions[self.current_step])
+        self.current_step += 1
+
+        if self.current_step % self.checkpoint_interval == 0 and self.current_step not in self.checkpoints:
+            self.checkpoints[self.current_step] = self.env.get_state()
+        return rewards
+
+
+def _equal(value_1, value_2):
+    # State values are arrays, tiled grids, tuples of arrays (sparse pheromones) or dicts (random generator state)
+    if isinstance(value_1, dict):
+        return value_1 == value_2
+    if isinstance(value_1, tuple):
+        return len(value_1) == len(value_2) and all(_equal(item_1, item_2) for item_1, item_2 in zip(value_1, value_2))
+    return np.array_equal(np.asarray(value_1), np.asarray(value_2))
@@ -1,19 +1,25 @@
 import copy
+import functools
 import logging
-import random
 
 import numpy as np
 logger = logging.getLogger(__name__)
 
-from PIL import ImageColor, Image
+from PIL import ImageColor
 import gym
 from gym import spaces
-from gym.utils import seeding
 
 from ma_gym.envs.utils.action_space import MultiAgentActionSpace
-from ma_gym.envs.utils.draw import draw_grid, fill_cell, draw_circle, write_cell_text
+from ma_gym.envs.utils.draw import draw_grid, fill_cell, draw_circle
 from ma_gym.envs.utils.observation_space import MultiAgentObservationSpace
 
+from aasma.artifact_writer import default_writer
+from aasma.simplified_predator_prey.raster import RasterRenderer, default_font, write_cell_text
+from aasma.simplified_predator_prey.step_profiler import StepProfiler, PENALTY_HEAT_MAP, EVAPORATION, TRANSFERS, MOVES, FOODPILES, COLONIES, \
+    TERMINATION, GET_AGENT_OBS, SIMPLIFIED_FEATURES, FORMAT_OUTGOING_OBSERVATIONS
+from aasma.simplified_predator_prey.pheromones import DensePheromones, SparsePheromones, SPARSE_PHEROMONES_MIN_CELLS
+from aasma.simplified_predator_prey.tiled_grid import TiledGrid, TILED_WORLD_MIN_CELLS
+
 class AntColonyEnv(gym.Env):
 
     """A simplified version of ma_gym.envs.predator_prey.predator_prey.PredatorPrey
@@ -25,26 +31,36 @@ class AntColonyEnv(gym.Env):
     def __init__(self, grid_shape=(5, 5), n_agents=2, full_observable=False, penalty=-0.5, step_cost=-0.01, max_steps=100,
                  n_foodpiles=3, foodpile_capture_reward=5, initial_foodpile_capacity=8, foodpile_capacity_decrement=2,
                  n_colonies=1, initial_colonies_storage=100, colonies_storage_decrement=1, colonies_storage_increment=20, colonies_deposit_reward=10,
-                 initial_pheromone_intensity=5, food_pheromone_intensity=50, pheromone_evaporation_rate=1, n_episodes=100):
+                 initial_pheromone_intensity=5, food_pheromone_intensity=50, pheromone_evaporation_rate=1, n_episodes=100,
+                 copy_observations=False, sparse_pheromones=None, tiled_world=None, render_backend='pil', render_text=True,
+                 profile_steps=False, view_radius=2, batched_moves=False,
+                 batched_spawning=True, layout_cache=None):
         
         self._grid_shape = grid_shape
+
+        # Grid layers are split into lazily allocated tiles on huge maps (tiled_world=None picks from the map size)
+        self.tiled_world = np.prod(self._grid_shape) >= TILED_WORLD_MIN_CELLS if tiled_world is None else tiled_world
         self.n_agents = n_agents
         self._max_steps = max_steps
         self._step_count = None
+        self.batched_moves = batched_moves # resolve all moves at once instead of agent by agent (see __move_agents_batched)
+        self.batched_spawning = batched_spawning # place everything from one draw at reset (see __spawn_batched), False retries random cells
         self._penalty = penalty
         self._step_cost = step_cost
-        self._agent_view_mask = (5, 5)
+        assert view_radius >= 2, f"View radius {view_radius} too small, the agents need at least 2 (see ViewTables)."
+        self.view_radius = view_radius # the agents need the same one
+        self._agent_view_mask = (2 * view_radius + 1, 2 * view_radius + 1) # agents see the cells up to view_radius away (5x5 by default)
 
         # Heat map
-        self.heat_map = [[0 for _ in range(self._grid_shape[0])] for row in range(self._grid_shape[1])]
+        self.heat_map = self._new_layer(np.int32)
 
         # Foodpiles
         self.n_foodpiles = n_foodpiles
         self.foodpile_depleted = None
-        self.foodpile_pos = {_: None for _ in range(self.n_foodpiles)}
+        self.foodpile_pos = np.zeros((self.n_foodpiles, 2), dtype=int) # [row, col] of each foodpile
         self.initial_foodpile_capacity = initial_foodpile_capacity
-        self.foodpile_capacity = {_: random.randrange(4, self.initial_foodpile_capacity, 2) for _ in range(self.n_foodpiles)}
-        self.initial_foodpile_capacities = self.foodpile_capacity
+        self.foodpile_capacity = None # drawn at every reset
+        self.initial_foodpile_capacities = None
         self.foodpile_capture_reward = foodpile_capture_reward
         self.foodpiles_done = False
         self.foodpile_capacity_decrement = foodpile_capacity_decrement
@@ -54,7 +70,7 @@ class AntColonyEnv(gym.Env):
 
         # Colonies
         self.n_colonies = n_colonies
-        self.colonies_pos = {_: None for _ in range(self.n_colonies)}
+        self.colonies_pos = np.zeros((self.n_colonies, 2), dtype=int) # [row, col] of each colony
         self.initial_colonies_storage = initial_colonies_storage
         self.colonies_storage_decrement = colonies_storage_decrement
         self.colonies_storage = {_: self.initial_colonies_storage for _ in range(self.n_colonies)}
@@ -62,17 +78,43 @@ class AntColonyEnv(gym.Env):
         self.colonies_deposit_reward = colonies_deposit_reward
 
         # Pheromones
-        self.pheromones_in_grid = [[0 for _ in range(self._grid_shape[0])] for row in range(self._grid_shape[1])] # keep pheromone level for each grid cell
+        # Pheromone level of each grid cell, only the active cells are stored on large maps (sparse_pheromones=None picks from the map size)
+        if sparse_pheromones is None:
+            sparse_pheromones = np.prod(self._grid_shape) >= SPARSE_PHEROMONES_MIN_CELLS
+        self.pheromones = SparsePheromones(self._grid_shape) if sparse_pheromones else DensePheromones(self._grid_shape)
+        # The stores hold integer intensities, whole floats (e.g. 2.0) are accepted
+        for name, value in (('initial_pheromone_intensity', initial_pheromone_intensity), ('food_pheromone_intensity', food_pheromone_intensity),
+                            ('pheromone_evaporation_rate', pheromone_evaporation_rate)):
+            if not float(value).is_integer():
+                raise ValueError(f"{name} must be a whole number (pheromone intensities are integers), got {value}.")
+        initial_pheromone_intensity, food_pheromone_intensity = int(initial_pheromone_intensity), int(food_pheromone_intensity)
+        pheromone_evaporation_rate = int(pheromone_evaporation_rate)
         self.initial_pheromone_intensity = initial_pheromone_intensity
         self.food_pheromone_intensity = food_pheromone_intensity
         self.pheromone_evaporation_rate = pheromone_evaporation_rate
         self.n_pheromone = 0
 
+        # Initial states of seeded episodes, restored instead of generated again (see LayoutCache)
+        self.layout_cache = layout_cache
+        self._layout_config = (tuple(self._grid_shape), self.n_agents, self.n_foodpiles, self.n_colonies, self.initial_foodpile_capacity,
+                               self.initial_colonies_storage, self.batched_spawning, self.tiled_world, type(self.pheromones).__name__)
+        self._layout_seed = None # seed of the next reset, if it can be cached
+
         self.action_space = MultiAgentActionSpace([spaces.Discrete(11) for _ in range(self.n_agents)])
-        self.agent_pos = {_: None for _ in range(self.n_agents)}
+        self.agent_pos = np.zeros((self.n_agents, 2), dtype=int) # [row, col] of each agent, updated as agents move
+
+        self.__create_grid()
+        self._base_img = None # drawn on the first render, only depends on the grid shape
+        self._frame, self._frame_drawings = None, None # last rendered frame, updated cell by cell
+
+        # render_backend='raster' draws frames with array operations instead of PIL calls (render_text=False skips the text for speed)
+        assert render_backend in ('pil', 'raster'), f"Unknown render backend {render_backend}."
+        self.render_backend = render_backend
+        self.render_text = render_text
+        self._raster = None
 
-        self._base_grid = self.__create_grid()  # with no agents
-        self._full_obs = self.__create_grid()
+        # Per-phase timings of step (see StepProfiler), also returned in the step info as 'step_profile'
+        self.step_profiler = StepProfiler() if profile_steps else None
         self._agent_dones = [False for _ in range(self.n_agents)]
         self.viewer = None
         self.full_observable = full_observable
@@ -87,6 +129,18 @@ class AntColonyEnv(gym.Env):
         self.observation_space = MultiAgentObservationSpace(
             [spaces.Box(self._obs_low, self._obs_high) for _ in range(self.n_agents)])
 
+        # View offsets (from the top-left corner of the view area) used to gather every agent's view at once
+        self._view_padding = ((self._agent_view_mask[0] // 2, ) * 2, (self._agent_view_mask[1] // 2, ) * 2)
+        self._view_rows, self._view_cols = [offsets.reshape(-1) for offsets in np.indices(self._agent_view_mask)]
+
+        # foodpiles (25), pheromones (25), colonies storage (1 per colony), has food (1), other agents (25)
+        self._agent_obs = np.zeros((self.n_agents, 3 * mask_size + self.n_colonies + 1))
+
+        # Observations returned by reset/step: agent pos (2), colony pos (2) and the agent obs above
+        # By default a read-only view of this buffer is returned, copy_observations=True returns a fresh copy instead
+        self.copy_observations = copy_observations
+        self._outgoing_observations = np.zeros((self.n_agents, 4 + self._agent_obs.shape[1] * (self.n_agents if self.full_observable else 1)))
+
         self._total_episode_reward = None
         self.seed()
 
@@ -94,45 +148,44 @@ class AntColonyEnv(gym.Env):
 
     def simplified_features(self):
 
-        current_grid = np.array(self._full_obs)
-
-        agent_pos = []
-        for agent_id in range(self.n_agents):
-            tag = f"A{agent_id + 1}"
-            row, col = np.where(current_grid == tag)
-            row = row[0]
-            col = col[0]
-            agent_pos.append((col, row))
-
-        # Create tags for grids with foodpiles (possibly can be eliminated?)
-        foodpile_pos = []
-        for foodpile_id in range(self.n_foodpiles):
-            if (not self.foodpile_depleted[foodpile_id]):
-                tag = f"F{foodpile_id + 1}"
-                row, col = np.where(current_grid == tag)
-                row = row[0]
-                col = col[0]
-                foodpile_pos.append((col, row))
-
-        # Create tags for grids with colonies
-        colonies_pos = []
-        for colonies_id in range(self.n_colonies):
-            tag = f"C{colonies_id + 1}"
-            row, col = np.where(current_grid == tag)
-            row = row[0] 
-            col = col[0]
-            colonies_pos.append((col, row))
-            
+        # Positions are kept as [row, col] while agents see them as (col, row)
+        agent_pos = self.agent_pos[:, ::-1]
+        colonies_pos = self.colonies_pos[:, ::-1]
+
         # At each time step, the agent knows its own position and the colony's position
-        features = np.array(agent_pos + colonies_pos).reshape(-1)
+        features = np.concatenate((agent_pos, colonies_pos)).reshape(-1)
 
         return features
 
     def reset(self):
+        self._reset_state()
+
+        # Concatenate observed environment to features
+        observed_environment = self.get_agent_obs() # 77 for each agent
+        features = self.simplified_features() # 2 for each agent + 2 for each colony
+
+        separated_full_information = self.format_outgoing_observations(features, observed_environment)
+
+        return separated_full_information
+
+    def _reset_state(self):
+        # Start a new episode without building observations (also used by VecAntColonyEnv to generate its maps)
+        layout_key = None
+        if self.layout_cache is not None and self._layout_seed is not None:
+            layout_key = (self._layout_seed, self._layout_config)
+            state = self.layout_cache.get(layout_key)
+            if state is not None:
+                self.set_state(state) # copies the arrays, the cached state is never modified
+                self.pheromones_pos = {}
+                self.initial_foodpile_capacities = dict(self.foodpile_capacity)
+                self._layout_seed = None
+                return
+        self._layout_seed = None
+
         self._total_episode_reward = [0 for _ in range(self.n_agents)]
-        self.agent_pos = {}
-        self.foodpile_pos = {}
-        self.colonies_pos = {}
+        self.agent_pos = np.zeros((self.n_agents, 2), dtype=int)
+        self.foodpile_pos = np.zeros((self.n_foodpiles, 2), dtype=int)
+        self.colonies_pos = np.zeros((self.n_colonies, 2), dtype=int)
 
         self.pheromones_pos = {}
 
@@ -141,15 +194,16 @@ class AntColonyEnv(gym.Env):
         self._agent_dones = [False for _ in range(self.n_agents)]
         
         # Reset heat map
-        self.heat_map = [[0 for _ in range(self._grid_shape[0])] for row in range(self._grid_shape[1])]
+        self.heat_map = self._new_layer(np.int32)
 
         # Reset foodpiles
-        self.foodpile_capacity = {_: random.randrange(4, self.initial_foodpile_capacity, 2) for _ in range(self.n_foodpiles)} 
+        self.foodpile_capacity = dict(enumerate(self.np_random.choice(np.arange(4, self.initial_foodpile_capacity, 2), self.n_foodpiles).tolist()))
+        self.initial_foodpile_capacities = dict(self.foodpile_capacity) # shown in the heat map
         self.foodpile_depleted = [False for _ in range(self.n_foodpiles)]
         self.foodpiles_done = False
 
         # Reset pheromones in grid
-        self.pheromones_in_grid = [[0 for _ in range(self._grid_shape[0])] for row in range(self._grid_shape[1])]
+        self.pheromones.clear()
 
         # Reset colonies
         self.colonies_storage = {_: self.initial_colonies_storage for _ in range(self.n_colonies)} 
@@ -157,15 +211,34 @@ class AntColonyEnv(gym.Env):
         # Reset food flag
         self.has_food = [0 for _ in range(self.n_agents)]
 
-        # Concatenate observed environment to features
+        if layout_key is not None:
+            self.layout_cache.put(layout_key, self.get_state())
+
+    def step(self, agents_action):
+        rewards = self._step_state(agents_action)
+        profiler = self.step_profiler
+
         observed_environment = self.get_agent_obs() # 77 for each agent
+        if profiler is not None: profiler.lap(GET_AGENT_OBS)
         features = self.simplified_features() # 2 for each agent + 2 for each colony
+        if profiler is not None: profiler.lap(SIMPLIFIED_FEATURES)
 
         separated_full_information = self.format_outgoing_observations(features, observed_environment)
+        if profiler is not None: profiler.lap(FORMAT_OUTGOING_OBSERVATIONS)
 
-        return separated_full_information
+        # [agent_pos colony_pos 25*foodpiles 25*pheromones colony_capacity has_food]
+
+        info = {'foodpiles_done': self.foodpiles_done, 'colony_storage': self.colonies_storage[0]}
+        if profiler is not None: info['step_profile'] = profiler.last_step # ns spent in each phase of this step
+
+        return separated_full_information, rewards, self._agent_dones, info
+
+    def _step_state(self, agents_action):
+        # Advance the episode by one step without building observations, returns the rewards (also used by ActionReplay)
+        # With profile_steps, the time of every phase is recorded by self.step_profiler (each check costs tens of ns otherwise)
+        profiler = self.step_profiler
+        if profiler is not None: profiler.start()
 
-    def step(self, agents_action):
         self._step_count += 1
         rewards = [self._step_cost for _ in range(self.n_agents)]
 
@@ -175,25 +248,21 @@ class AntColonyEnv(gym.Env):
                 rewards[agent_i] += self._penalty
 
             # Update heat map with current agent pos
-            self.heat_map[self.agent_pos[agent_i][0]][self.agent_pos[agent_i][1]] += 1
+            self.heat_map[self.agent_pos[agent_i][0], self.agent_pos[agent_i][1]] += 1
+        if profiler is not None: profiler.lap(PENALTY_HEAT_MAP)
 
         # Decrease intensity of pheromones
-        for row in range(self._grid_shape[0]):
-            for col in range(self._grid_shape[1]):
-
-                if (self.pheromones_in_grid[col][row] > 0):
-                   self.pheromones_in_grid[col][row] -= self.pheromone_evaporation_rate
-
-                   if(self.pheromones_in_grid[col][row] < self.pheromone_evaporation_rate):
-                        self.pheromones_in_grid[col][row] = 0
-                        if('A' not in self._full_obs[col][row]):
-                            self._full_obs[col][row] = PRE_IDS['empty'] # this needs to be switched
+        self.__evaporate_pheromones()
+        if profiler is not None: profiler.lap(EVAPORATION)
 
+        # Agents adjacent to every agent, gathered at once (no agent moves before the transfers)
+        agents_neighbours = self._neighbour_agents_batch(self.agent_pos)
 
         for agent_i, action in enumerate(agents_action):
                 if(action == 11 and self.has_food[agent_i] == 0):
                     # If there are enough agents nearby to capture the foodpile...
-                    ant_neighbour_count, surrounding_agents_i = self._neighbour_agents(self.agent_pos[agent_i])
+                    surrounding_agents_i = agents_neighbours[agent_i][agents_neighbours[agent_i] >= 0]
+                    ant_neighbour_count = len(surrounding_agents_i)
                     
                     if ant_neighbour_count >= 1: # only takes 1 ant to capture piece of foodpile
                         for i in range(ant_neighbour_count): # if the surrounding agents don't have food and choose to collect food..
@@ -206,17 +275,27 @@ class AntColonyEnv(gym.Env):
                                 self.has_food[agent_i] = 1
                                 self.has_food[other_agent_i] = 1
                                 break
+        if profiler is not None: profiler.lap(TRANSFERS)
 
-        for agent_i, action in enumerate(agents_action):
-            if not (self._agent_dones[agent_i]):
-                self.__update_agent_pos(agent_i, action) # this was also update for the pheromones
+        if self.batched_moves:
+            self.__move_agents_batched(agents_action)
+        else:
+            for agent_i, action in enumerate(agents_action):
+                if not (self._agent_dones[agent_i]):
+                    self.__update_agent_pos(agent_i, action) # this was also update for the pheromones
+        if profiler is not None: profiler.lap(MOVES)
+
+        # Agents adjacent to every foodpile and colony, gathered at once (agents don't move from here on)
+        foodpiles_neighbours = self._neighbour_agents_batch(self.foodpile_pos)
+        colonies_neighbours = self._neighbour_agents_batch(self.colonies_pos)
 
         # Update foodpiles
         for foodpile_i in range(self.n_foodpiles):
             if (not self.foodpile_depleted[foodpile_i]):
 
                 # If there are enough agents nearby to capture the foodpile...
-                ant_neighbour_count, surrounding_agents_i = self._neighbour_agents(self.foodpile_pos[foodpile_i])
+                surrounding_agents_i = foodpiles_neighbours[foodpile_i][foodpiles_neighbours[foodpile_i] >= 0]
+                ant_neighbour_count = len(surrounding_agents_i)
                 
                 if ant_neighbour_count >= 1: # only takes 1 ant to capture piece of foodpile
                     for i in range(ant_neighbour_count): # if the surrounding agents don't have food and choose to collect food..
@@ -232,14 +311,14 @@ class AntColonyEnv(gym.Env):
                             if(self.foodpile_capacity[foodpile_i] < 1):
                                 self.foodpile_depleted[foodpile_i] = True
                                 row, col = self.foodpile_pos[foodpile_i]
-                                self._full_obs[self.foodpile_pos[foodpile_i][0]][self.foodpile_pos[foodpile_i][1]] = PRE_IDS['empty']
+                                self._foodpiles_grid[row, col] = 0
 
                             # Rewards agent which got food
                             rewards[agent_i] += self.foodpile_capture_reward
 
                             # Signal flag
                             self.has_food[agent_i] = self.foodpile_capacity_decrement
-
+        if profiler is not None: profiler.lap(FOODPILES)
 
 
         # for agent_i in range(self.n_agents):
@@ -252,7 +331,8 @@ class AntColonyEnv(gym.Env):
         for colony_i in range(self.n_colonies):
 
             # Check what agents are near colony
-            ant_neighbour_count, surrounding_agents_i = self._neighbour_agents(self.colonies_pos[colony_i])
+            surrounding_agents_i = colonies_neighbours[colony_i][colonies_neighbours[colony_i] >= 0]
+            ant_neighbour_count = len(surrounding_agents_i)
 
             if(ant_neighbour_count >= 1):
                 for i in range(ant_neighbour_count):
@@ -272,6 +352,7 @@ class AntColonyEnv(gym.Env):
 
             if(self.colonies_storage[colony_i] > 1):
                 self.colonies_storage[colony_i] -= self.colonies_storage_decrement # We consider 1 to be the lowest food capacity possible (so 0 can mean ants can't see the colony)
+        if profiler is not None: profiler.lap(COLONIES)
                 
         # If we have reached max steps, if every foodpile has been depleted (and the agents are not holding food), if a colony reaches min capacity, we should also stop
         if (self._step_count >= self._max_steps) or (False not in self.foodpile_depleted and not any(self.has_food)) or (1 in self.colonies_storage):
@@ -282,57 +363,26 @@ class AntColonyEnv(gym.Env):
             self._total_episode_reward[i] += rewards[i]
 
         if (False not in self.foodpile_depleted): self.foodpiles_done = True
+        if profiler is not None: profiler.lap(TERMINATION)
 
-        observed_environment = self.get_agent_obs() # 77 for each agent
-        features = self.simplified_features() # 2 for each agent + 2 for each colony
-
-        separated_full_information = self.format_outgoing_observations(features, observed_environment)
-
-        # [agent_pos colony_pos 25*foodpiles 25*pheromones colony_capacity has_food]
-
-        return separated_full_information, rewards, self._agent_dones, {'foodpiles_done': self.foodpiles_done, 'colony_storage': self.colonies_storage[0]}
+        return rewards
 
     def format_outgoing_observations(self, features, observed_environment):
 
-        # Format the outgoing observations so they are separated by agent
-        agents_positions = features[:self.n_agents * 2] # 2 * n_agents
-        colonies_positions = features[-2 : ] # 1 COLONY
+        # Format the outgoing observations so they are separated by agent (filled in place, no new arrays per agent)
+        separated_full_information = self._outgoing_observations
 
-        #separated_full_information = np.zeros(len(full_information)).reshape(self.n_agents, 2 + 2 + 25 + 25 + 1 + 1 )
-
-        separated_full_information = np.array([])
-
-        for agent_id in range(self.n_agents):
-
-            # Get corresponding information in previous arrays
-            true_agent_id = agent_id * 2
-            agent_position = agents_positions[true_agent_id:true_agent_id + 2] # 2
-            colony_position = colonies_positions # 1 COLONY
-
-            foodpiles_in_view_for_agent_i = observed_environment[agent_id][ : 25] # 25
-            pheromones_in_view_for_agent_i = observed_environment[agent_id][25 : 50] # 25
-            colony_storage_in_view = observed_environment[agent_id][50:51] # 1
-            has_food_agent_i = observed_environment[agent_id][51:52] # 1
-            other_agents_in_view = observed_environment[agent_id][52:] # 25
-
-            # Concatenate information and add it to proper place 
-            p1 = np.concatenate((agent_position, colony_position))
-            p2 = np.concatenate((p1, foodpiles_in_view_for_agent_i))
-            p3 = np.concatenate((p2, pheromones_in_view_for_agent_i))
-            p4 = np.concatenate((p3, colony_storage_in_view))
-            p5 = np.concatenate((p4, has_food_agent_i))
-            
-            agent_i_full_information = np.concatenate((p5, other_agents_in_view))
-
-            if separated_full_information.size == 0:
-                separated_full_information = np.array([agent_i_full_information])
-            else:
-                separated_full_information = np.append(separated_full_information, [agent_i_full_information], axis=0)
+        separated_full_information[:, :2] = features[:self.n_agents * 2].reshape(self.n_agents, 2) # agent position (2)
+        separated_full_information[:, 2:4] = features[-2 : ] # colony position, 1 COLONY (2)
+        separated_full_information[:, 4:] = observed_environment # 25*foodpiles 25*pheromones colony_capacity has_food 25*other_agents
 
         # separated_full_information[agent_1] = [agent_pos colony_pos 25*foodpiles 25*pheromones colony_capacity has_food 25*other_agents]
         # separated_full_information[agent_id] = [separated_full_information[agent_1] separated_full_information[agent_2] ...]
 
-        return separated_full_information
+        if self.copy_observations:
+            return separated_full_information.copy()
+
+        return read_only_view(self._outgoing_observations) # overwritten by the next reset/step
 
     def get_action_meanings(self, agent_i=None):
         if agent_i is not None:
@@ -344,20 +394,100 @@ class AntColonyEnv(gym.Env):
     def action_space_sample(self):
         return [agent_action_space.sample() for agent_action_space in self.action_space]
 
+    def get_step_profile(self):
+        # Statistics of every phase of step since the env was built (or the profiler reset), None if profile_steps is off
+        return self.step_profiler.stats() if self.step_profiler is not None else None
+
+    def get_state(self):
+        """Snapshot of the mutable episode state as a bundle of arrays (restored with set_state, e.g. to branch lookahead rollouts)"""
+        return {
+            'agent_pos': self.agent_pos.copy(),
+            'foodpile_pos': self.foodpile_pos.copy(),
+            'colonies_pos': self.colonies_pos.copy(),
+            'agents_grid': self._agents_grid.copy(),
+            'foodpiles_grid': self._foodpiles_grid.copy(),
+            'colonies_grid': self._colonies_grid.copy(),
+            'pheromones_tag_grid': self._pheromones_tag_grid.copy(),
+            'pheromones': self.pheromones.get_state(),
+            'heat_map': self.heat_map.copy(),
+            'foodpile_capacity': np.array([self.foodpile_capacity[foodpile_i] for foodpile_i in range(self.n_foodpiles)]),
+            'foodpile_depleted': np.array(self.foodpile_depleted, dtype=bool),
+            'colonies_storage': np.array([self.colonies_storage[colony_i] for colony_i in range(self.n_colonies)]),
+            'has_food': np.array(self.has_food),
+            'agent_dones': np.array(self._agent_dones, dtype=bool),
+            'total_episode_reward': np.array(self._total_episode_reward, dtype=float),
+            'counters': np.array([self._step_count, self.foodpiles_done]), # step count, foodpiles done
+            'np_random': self.np_random.bit_generator.state,
+        }
+
+    def set_state(self, state):
+        # Arrays are copied into the env's own buffers, so the same snapshot can be restored any number of times
+        for name, array in (('agent_pos', self.agent_pos), ('foodpile_pos', self.foodpile_pos), ('colonies_pos', self.colonies_pos)):
+            np.copyto(array, state[name])
+
+        # Grid layers may be tiled, so they are replaced by copies
+        self._agents_grid = state['agents_grid'].copy()
+        self._foodpiles_grid = state['foodpiles_grid'].copy()
+        self._colonies_grid = state['colonies_grid'].copy()
+        self._pheromones_tag_grid = state['pheromones_tag_grid'].copy()
+        self.heat_map = state['heat_map'].copy()
+        self.pheromones.set_state(state['pheromones'])
+
+        self.foodpile_capacity = dict(enumerate(state['foodpile_capacity'].tolist()))
+        self.foodpile_depleted = state['foodpile_depleted'].tolist()
+        self.colonies_storage = dict(enumerate(state['colonies_storage'].tolist()))
+        self.has_food = state['has_food'].tolist()
+        self._agent_dones = state['agent_dones'].tolist()
+        self._total_episode_reward = state['total_episode_reward'].tolist()
+        self._step_count, self.foodpiles_done = int(state['counters'][0]), bool(state['counters'][1])
+        self.np_random.bit_generator.state = state['np_random']
+
     def __draw_base_img(self):
-        self._base_img = draw_grid(self._grid_shape[0], self._grid_shape[1], cell_size=CELL_SIZE, fill=GROUND_COLOR)
+        if self._base_img is None:
+            self._base_img = draw_grid(self._grid_shape[0], self._grid_shape[1], cell_size=CELL_SIZE, fill=GROUND_COLOR)
+        return self._base_img
+
+    def _new_layer(self, dtype):
+        # Empty grid layer, tiled on huge maps
+        return TiledGrid(self._grid_shape, dtype) if self.tiled_world else np.zeros(self._grid_shape, dtype=dtype)
 
     def __create_grid(self):
+        # Each layer keeps the id + 1 of the entity occupying a cell (0 means no entity of that kind)
+        self._agents_grid = self._new_layer(np.int16)
+        self._foodpiles_grid = self._new_layer(np.int16)
+        self._colonies_grid = self._new_layer(np.int16)
+
+        # Cells currently tagged as pheromones (the intensity itself lives in self.pheromones)
+        self._pheromones_tag_grid = self._new_layer(bool)
+
+    @property
+    def pheromones_in_grid(self):
+        """Pheromone level of each grid cell as a dense array (built on demand with the sparse store)"""
+        return self.pheromones.to_dense()
+
+    @property
+    def _full_obs(self):
+        """String view of the grid layers (e.g. 'A3', 'F2', 'C1', 'I', '0'), only meant for rendering/debugging"""
         _grid = [[PRE_IDS['empty'] for _ in range(self._grid_shape[1])] for row in range(self._grid_shape[0])]
+
+        for row, col in np.argwhere(self._pheromones_tag_grid):
+            _grid[row][col] = PRE_IDS['pheromone']
+        for pre_id, layer in ((PRE_IDS['colony'], self._colonies_grid), (PRE_IDS['foodpile'], self._foodpiles_grid), (PRE_IDS['agent'], self._agents_grid)):
+            for row, col in np.argwhere(layer):
+                _grid[row][col] = pre_id + str(layer[row, col])
+
         return _grid
 
     def __init_full_obs(self):
-        self._full_obs = self.__create_grid()
+        self.__create_grid()
+        if self.batched_spawning:
+            self.__spawn_batched()
+            return
 
         for agent_i in range(self.n_agents):
             while True:
-                pos = [self.np_random.randint(0, self._grid_shape[0] - 1),
-                       self.np_random.randint(0, self._grid_shape[1] - 1)]
+                pos = [self.np_random.integers(0, self._grid_shape[0] - 1),
+                       self.np_random.integers(0, self._grid_shape[1] - 1)]
                 if self._is_cell_spawnable(pos):
                     self.agent_pos[agent_i] = pos
                     break
@@ -366,95 +496,103 @@ class AntColonyEnv(gym.Env):
         # Randomly choose positions for foodpiles
         for foodpile_i in range(self.n_foodpiles):
             while True:
-                pos = [self.np_random.randint(0, self._grid_shape[0] - 1),
-                        self.np_random.randint(0, self._grid_shape[1] - 1)]
+                pos = [self.np_random.integers(0, self._grid_shape[0] - 1),
+                        self.np_random.integers(0, self._grid_shape[1] - 1)]
                 if self._is_cell_vacant(pos) and (self._neighbour_agents(pos)[0] == 0):
                     self.foodpile_pos[foodpile_i] = pos
                     break
-            self._full_obs[self.foodpile_pos[foodpile_i][0]][self.foodpile_pos[foodpile_i][1]] = PRE_IDS['foodpile'] + str(foodpile_i + 1)
+            self._foodpiles_grid[self.foodpile_pos[foodpile_i][0], self.foodpile_pos[foodpile_i][1]] = foodpile_i + 1
 
         # Randomly choose positions for colonies
         for colony_i in range(self.n_colonies):
             while True:
-                pos = [self.np_random.randint(0, self._grid_shape[0] - 1),
-                        self.np_random.randint(0, self._grid_shape[1] - 1)]
+                pos = [self.np_random.integers(0, self._grid_shape[0] - 1),
+                        self.np_random.integers(0, self._grid_shape[1] - 1)]
                 if self._is_cell_vacant(pos) and (self._neighbour_agents(pos)[0] == 0):
                     self.colonies_pos[colony_i] = pos
                     break
-            self._full_obs[self.colonies_pos[colony_i][0]][self.colonies_pos[colony_i][1]] = PRE_IDS['colony'] + str(colony_i + 1)
+            self._colonies_grid[self.colonies_pos[colony_i][0], self.colonies_pos[colony_i][1]] = colony_i + 1
+
+    def __spawn_batched(self):
+        # Same constraints as the loops of __init_full_obs (no agent next to a foodpile or a colony), but every entity takes
+        # the next allowed cell of a single random ordering of the spawn area, so the time does not depend on how crowded the
+        # grid is. Foodpiles and colonies are placed first, the agents then skip the cells next to them: at most 4 per foodpile
+        # or colony, which bounds the cells to draw. A draw leaving too few cells for the agents is redrawn
+        rows, cols = self._grid_shape[0] - 1, self._grid_shape[1] - 1 # spawn area of the loops (last row and column excluded)
+        n_landmarks = self.n_foodpiles + self.n_colonies
+        n_draws = min(rows * cols, 5 * n_landmarks + self.n_agents)
+        if n_draws < n_landmarks + self.n_agents:
+            raise Exception(f'No room to spawn {self.n_agents} agents, {self.n_foodpiles} foodpiles and {self.n_colonies} colonies!')
+
+        for _ in range(SPAWN_ATTEMPTS):
+            cells = np.stack(np.divmod(self.np_random.choice(rows * cols, n_draws, replace=False), cols), axis=1)
+            landmarks, cells = cells[:n_landmarks], cells[n_landmarks:]
+
+            # Cells of and next to the foodpiles and colonies (the grid is padded by one cell)
+            near_landmarks = np.zeros((self._grid_shape[0] + 2, self._grid_shape[1] + 2), dtype=bool)
+            for offset in ((0, 0), *NEIGHBOUR_OFFSETS):
+                near_landmarks[landmarks[:, 0] + 1 + offset[0], landmarks[:, 1] + 1 + offset[1]] = True
+            cells = cells[~near_landmarks[cells[:, 0] + 1, cells[:, 1] + 1]]
+            if len(cells) >= self.n_agents:
+                break
+        else:
+            raise Exception(f'No room to spawn {self.n_agents} agents away from {self.n_foodpiles} foodpiles and {self.n_colonies} colonies!')
 
-        self.__draw_base_img()
+        self.foodpile_pos[:] = landmarks[:self.n_foodpiles]
+        self.colonies_pos[:] = landmarks[self.n_foodpiles:]
+        self.agent_pos[:] = cells[:self.n_agents]
+        self._foodpiles_grid[self.foodpile_pos[:, 0], self.foodpile_pos[:, 1]] = np.arange(1, self.n_foodpiles + 1)
+        self._colonies_grid[self.colonies_pos[:, 0], self.colonies_pos[:, 1]] = np.arange(1, self.n_colonies + 1)
+        self._agents_grid[self.agent_pos[:, 0], self.agent_pos[:, 1]] = np.arange(1, self.n_agents + 1)
 
     def get_agent_obs(self):
-        _obs = []
+        mask_size = self._view_rows.size
+        _obs = self._agent_obs
 
-        for agent_i in range(self.n_agents):
-            pos = self.agent_pos[agent_i]
-            #_agent_i_obs = [pos[0] / (self._grid_shape[0] - 1), pos[1] / (self._grid_shape[1] - 1)]  # coordinates
-
-            # check if foodpile is in the view area
-            _foodpile_pos = np.zeros(self._agent_view_mask)  # foodpile location in neighbour
-            for row in range(max(0, pos[0] - 2), min(pos[0] + 2 + 1, self._grid_shape[0])):
-                for col in range(max(0, pos[1] - 2), min(pos[1] + 2 + 1, self._grid_shape[1])):
-                    if PRE_IDS['foodpile'] in self._full_obs[row][col]:
-                        foodpile_i = int(self._full_obs[row][col].strip('F')) - 1 # from F3 to 2
-                        _foodpile_pos[row - (pos[0] - 2), col - (pos[1] - 2)] = self.foodpile_capacity[foodpile_i]  # get relative position for the foodpile loc.
-                    
-            # check if pheromones is in the view area
-            _pheromone_pos = np.zeros(self._agent_view_mask)  # pheromone location in neighbour
-            for row in range(max(0, pos[0] - 2), min(pos[0] + 2 + 1, self._grid_shape[0])):
-                for col in range(max(0, pos[1] - 2), min(pos[1] + 2 + 1, self._grid_shape[1])):
-                    if PRE_IDS['pheromone'] in self._full_obs[row][col]:
-                        _pheromone_pos[row - (pos[0] - 2), col - (pos[1] - 2)] = self.pheromones_in_grid[row][col]  # get relative position for the pheromone loc.
-
-            # check if colony is in the view area
-            _colonies_storage = np.zeros(self.n_colonies)  # colony
-            for row in range(max(0, pos[0] - 2), min(pos[0] + 2 + 1, self._grid_shape[0])):
-                for col in range(max(0, pos[1] - 2), min(pos[1] + 2 + 1, self._grid_shape[1])):
-                    if PRE_IDS['colony'] in self._full_obs[row][col]:
-                        colony_i = int(self._full_obs[row][col].strip('C')) - 1 # from C1 to 0
-                        _colonies_storage[colony_i] = self.colonies_storage[colony_i] # get relative position for the colony loc.
-
-            #check if other agents are in the view area
-            _other_agents_pos = np.zeros(self._agent_view_mask)
-            for row in range(max(0, pos[0] - 2), min(pos[0] + 2 + 1, self._grid_shape[0])):
-                for col in range(max(0, pos[1] - 2), min(pos[1] + 2 + 1, self._grid_shape[1])):
-                    if PRE_IDS['agent'] in self._full_obs[row][col]:
-                        _other_agent_i = int(self._full_obs[row][col].strip('A')) - 1 # from A1 to 0    
-                        _other_agents_pos[row - (pos[0] - 2), col - (pos[1] - 2)] = self.has_food[_other_agent_i] # get relative position for the agent loc.
+        # Lookup tables indexed by the grid layers (entry 0 stands for "no entity in this cell")
+        foodpile_capacity_lookup = np.array([0] + [self.foodpile_capacity[foodpile_i] for foodpile_i in range(self.n_foodpiles)])
+        has_food_lookup = np.array([0] + list(self.has_food))
 
-        
-            _agent_i_obs = _foodpile_pos.flatten().tolist()  # adding foodpile pos in observable area
-            _agent_i_obs += _pheromone_pos.flatten().tolist()  # adding pheromone pos in observable area
-            _agent_i_obs += _colonies_storage.flatten().tolist()  # adding colonies pos in observable area
-            _agent_i_obs += [self.has_food[agent_i]] # adding has_food flag in observable area
-            _agent_i_obs += _other_agents_pos.flatten().tolist() #adding neighbours positions to agent obs
+        # Coordinates of every cell in every agent's view area (n_agents x mask_size), only the cells inside the grid are read
+        view_rows = self.agent_pos[:, 0:1] + (self._view_rows - self._view_padding[0][0])
+        view_cols = self.agent_pos[:, 1:2] + (self._view_cols - self._view_padding[1][0])
+        in_grid = (view_rows >= 0) & (view_rows < self._grid_shape[0]) & (view_cols >= 0) & (view_cols < self._grid_shape[1])
+        view_rows, view_cols = view_rows.clip(0, self._grid_shape[0] - 1), view_cols.clip(0, self._grid_shape[1] - 1)
 
-            #_agent_i_obs += [self._step_count / self._max_steps]  # adding time
+        # check if foodpiles are in the view area
+        _obs[:, :mask_size] = foodpile_capacity_lookup[np.where(in_grid, self._foodpiles_grid[view_rows, view_cols], 0)]
 
-            _obs.append(_agent_i_obs)
+        # check if pheromones are in the view area
+        tagged = in_grid & self._pheromones_tag_grid[view_rows, view_cols]
+        _obs[:, mask_size:2 * mask_size] = np.where(tagged, self.pheromones.values(view_rows, view_cols), 0)
+
+        # check if colonies are in the view area
+        colonies_in_view = np.where(in_grid, self._colonies_grid[view_rows, view_cols], 0)
+        for colony_i in range(self.n_colonies):
+            _obs[:, 2 * mask_size + colony_i] = np.where((colonies_in_view == colony_i + 1).any(axis=1), self.colonies_storage[colony_i], 0)
+
+        # adding has_food flag
+        _obs[:, 2 * mask_size + self.n_colonies] = self.has_food
+
+        # check if other agents are in the view area
+        _obs[:, 2 * mask_size + self.n_colonies + 1:] = has_food_lookup[np.where(in_grid, self._agents_grid[view_rows, view_cols], 0)]
 
         if self.full_observable:
-            _obs = np.array(_obs).flatten().tolist()
-            _obs = [_obs for _ in range(self.n_agents)]
+            _obs = np.tile(_obs.reshape(-1), (self.n_agents, 1))
 
         return _obs # [[_agent_1_obs] [_agent_2_obs] ...]
 
-    def __wall_exists(self, pos):
-        row, col = pos
-        return PRE_IDS['wall'] in self._base_grid[row, col]
-
     def is_valid(self, pos):
         return (0 <= pos[0] < self._grid_shape[0]) and (0 <= pos[1] < self._grid_shape[1])
     
     def _is_cell_spawnable(self, pos):
-        return self.is_valid(pos) and (self._full_obs[pos[0]][pos[1]] == PRE_IDS['empty'])
+        return self._is_cell_vacant(pos)
 
     def _is_cell_walkable(self, pos):
-        return self.is_valid(pos) and ((self._full_obs[pos[0]][pos[1]] == PRE_IDS['empty']) or (self._full_obs[pos[0]][pos[1]] == PRE_IDS['pheromone']))
+        return self.is_valid(pos) and not (self._agents_grid[pos[0], pos[1]] or self._foodpiles_grid[pos[0], pos[1]] or self._colonies_grid[pos[0], pos[1]])
     
     def _is_cell_vacant(self, pos):
-        return self.is_valid(pos) and (self._full_obs[pos[0]][pos[1]] == PRE_IDS['empty'])
+        return self._is_cell_walkable(pos) and not self._pheromones_tag_grid[pos[0], pos[1]]
 
     def __update_agent_pos(self, agent_i, move):
 
@@ -508,39 +646,81 @@ class AntColonyEnv(gym.Env):
                 self.agent_pos[agent_i] = next_pos
                 
                 # Add pheromones to last location
-                self._full_obs[curr_pos[0]][curr_pos[1]] = PRE_IDS['empty'] # now the last position is going to have the pheromone tag instead of empty
+                self._agents_grid[curr_pos[0], curr_pos[1]] = 0 # now the last position is going to have the pheromone tag instead of empty
+                self._pheromones_tag_grid[curr_pos[0], curr_pos[1]] = False
 
                 self.__update_agent_view(agent_i) # this should always happen to prevent pheromone + NOOP => empy cell with agent in there ;(
 
                 if(move == 5 or move == 6 or move == 7 or move == 8):
-                    self._full_obs[curr_pos[0]][curr_pos[1]] = PRE_IDS['pheromone']
-                    self.pheromones_in_grid[curr_pos[0]][curr_pos[1]] += self.food_pheromone_intensity # currently stacks pheromones
+                    self._pheromones_tag_grid[curr_pos[0], curr_pos[1]] = True
+                    self.pheromones.deposit(curr_pos[0], curr_pos[1], self.food_pheromone_intensity) # currently stacks pheromones
+
+    def __move_agents_batched(self, agents_action):
+        # Same rules as __update_agent_pos, applied to every agent at once so the outcome does not depend on the agents order:
+        # a move is blocked by the cells occupied at the start of the step, and when several agents head to the same free
+        # cell only the one with the lowest id gets in
+        actions = np.asarray(agents_action)
+        if ((actions < 0) | (actions >= len(MOVE_OFFSETS))).any():
+            raise Exception('Action Not found!')
+
+        has_food = np.array(self.has_food) != 0
+        moving = (MOVE_OFFSETS[actions] != 0).any(axis=1) & ~np.array(self._agent_dones, dtype=bool)
+        moving &= has_food | ~PHEROMONE_MOVES[actions] # ants need food to lay pheromones
+
+        current = self.agent_pos
+        target = current + MOVE_OFFSETS[actions]
+        moving &= (target >= 0).all(axis=1) & (target < self._grid_shape).all(axis=1)
+
+        movers = np.flatnonzero(moving)
+        rows, cols = target[movers, 0], target[movers, 1]
+        free = (self._agents_grid[rows, cols] == 0) & (self._foodpiles_grid[rows, cols] == 0) & (self._colonies_grid[rows, cols] == 0)
+        movers, rows, cols = movers[free], rows[free], cols[free]
+
+        # Contested cells go to the lowest id (movers are sorted by id, np.unique keeps the first occurrence)
+        _, first = np.unique(rows * self._grid_shape[1] + cols, return_index=True)
+        movers, rows, cols = movers[first], rows[first], cols[first]
+
+        # Leave the old cells (tagged if pheromones are laid) and take the new ones
+        old_rows, old_cols = current[movers, 0], current[movers, 1]
+        self._agents_grid[old_rows, old_cols] = 0
+        self._pheromones_tag_grid[old_rows, old_cols] = PHEROMONE_MOVES[actions[movers]]
+        self._agents_grid[rows, cols] = movers + 1
+        self._pheromones_tag_grid[rows, cols] = False
+        self.agent_pos[movers, 0], self.agent_pos[movers, 1] = rows, cols
+
+        layers = PHEROMONE_MOVES[actions[movers]]
+        self.pheromones.deposit_many(old_rows[layers], old_cols[layers], self.food_pheromone_intensity)
+
+    def __evaporate_pheromones(self):
+        # Every cell holding pheromones loses the evaporation rate, and the ones left below it are cleared
+        rows, cols = self.pheromones.evaporate(self.pheromone_evaporation_rate)
+
+        free = self._agents_grid[rows, cols] == 0 # cells under an agent keep their tag
+        self._pheromones_tag_grid[rows[free], cols[free]] = False
 
     def __update_agent_view(self, agent_i):
-        self._full_obs[self.agent_pos[agent_i][0]][self.agent_pos[agent_i][1]] = PRE_IDS['agent'] + str(agent_i + 1)
+        self._agents_grid[self.agent_pos[agent_i][0], self.agent_pos[agent_i][1]] = agent_i + 1
+        self._pheromones_tag_grid[self.agent_pos[agent_i][0], self.agent_pos[agent_i][1]] = False # the agent covers any pheromone tag
 
     def _neighbour_agents(self, pos):
         # check if agent is in neighbour
         _count = 0
-        neighbours_xy = []
-        if self.is_valid([pos[0] + 1, pos[1]]) and PRE_IDS['agent'] in self._full_obs[pos[0] + 1][pos[1]]:
-            _count += 1
-            neighbours_xy.append([pos[0] + 1, pos[1]])
-        if self.is_valid([pos[0] - 1, pos[1]]) and (PRE_IDS['agent'] in self._full_obs[pos[0] - 1][pos[1]]):
-            _count += 1
-            neighbours_xy.append([pos[0] - 1, pos[1]])
-        if self.is_valid([pos[0], pos[1] + 1]) and PRE_IDS['agent'] in self._full_obs[pos[0]][pos[1] + 1]:
-            _count += 1
-            neighbours_xy.append([pos[0], pos[1] + 1])
-        if self.is_valid([pos[0], pos[1] - 1]) and PRE_IDS['agent'] in self._full_obs[pos[0]][pos[1] - 1]:
-            neighbours_xy.append([pos[0], pos[1] - 1])
-            _count += 1
-
         agent_id = []
-        for x, y in neighbours_xy:
-            agent_id.append(int(self._full_obs[x][y].split(PRE_IDS['agent'])[1]) - 1)
+        for neighbour in ([pos[0] + 1, pos[1]], [pos[0] - 1, pos[1]], [pos[0], pos[1] + 1], [pos[0], pos[1] - 1]):
+            if self.is_valid(neighbour) and self._agents_grid[neighbour[0], neighbour[1]]:
+                _count += 1
+                agent_id.append(int(self._agents_grid[neighbour[0], neighbour[1]]) - 1)
         return _count, agent_id
 
+    def _neighbour_agents_batch(self, positions):
+        # Ids of the agents adjacent to each [row, col] position, in the same order as _neighbour_agents (-1 if there is none)
+        rows = positions[:, 0:1] + NEIGHBOUR_OFFSETS[:, 0]
+        cols = positions[:, 1:2] + NEIGHBOUR_OFFSETS[:, 1]
+        valid = (rows >= 0) & (rows < self._grid_shape[0]) & (cols >= 0) & (cols < self._grid_shape[1])
+
+        neighbours = self._agents_grid[rows.clip(0, self._grid_shape[0] - 1), cols.clip(0, self._grid_shape[1] - 1)]
+        return np.where(valid, neighbours, 0).astype(int) - 1
+
     def __get_neighbour_coordinates(self, pos):
         neighbours = []
         if self.is_valid([pos[0] + 1, pos[1]]):
@@ -553,15 +733,44 @@ class AntColonyEnv(gym.Env):
             neighbours.append([pos[0], pos[1] - 1])
         return neighbours
 
-    def render_heat_map(self, mode='rgb_array'):
-        heat_map_img = copy.copy(self._base_img)
+    def __render_pil(self):
+        drawings = self.__frame_drawings()
+
+        if self._frame is not None:
+            # Only the cells whose drawings changed since the last frame are redrawn, with the cells their text spills into (right and below)
+            dirty = set()
+            for row, col in drawings.keys() | self._frame_drawings.keys():
+                cell_drawings, last_cell_drawings = drawings.get((row, col), []), self._frame_drawings.get((row, col), [])
+                if [drawing[1:] for drawing in cell_drawings] != [drawing[1:] for drawing in last_cell_drawings]:
+                    dirty.add((row, col))
+                    if any(spilling_text(drawing) for drawing in cell_drawings + last_cell_drawings):
+                        dirty.update(((row + 1, col), (row, col + 1), (row + 1, col + 1)))
+
+        if self._frame is None or len(dirty) > len(drawings): # first frame, or redrawing cell by cell would cost more than a full frame
+            img = copy.copy(self.__draw_base_img())
+            for _, draw_function, pos, kwargs in sorted((order, draw_function, cell, kwargs) for cell, cell_drawings in drawings.items()
+                                                           for order, draw_function, kwargs in cell_drawings):
+                draw_function(img, pos=pos, cell_size=CELL_SIZE, **kwargs)
+
+        else:
+            img = self._frame
+            for row, col in dirty:
+                if self.is_valid((row, col)):
+                    self.__redraw_cell(img, row, col, drawings)
+
+        self._frame, self._frame_drawings = img, drawings
+
+        return img
+
+    def __render_heat_map_pil(self):
+        heat_map_img = copy.copy(self.__draw_base_img())
         
         for row in range(self._grid_shape[0]):
             for col in range(self._grid_shape[1]):
                 # Draw heat map values
-                fill_cell(heat_map_img, [col, row], cell_size=CELL_SIZE, fill=color_lerp(HEAT_MAP_BASE_COLOR, HEAT_MAP_MAX_COLOR, self.heat_map[col][row]/20), margin=0.1)
-                if(self.heat_map[col][row]!=0):
-                    write_cell_text(heat_map_img, text=str(self.heat_map[col][row]), pos=[col, row], cell_size=CELL_SIZE, fill='white', margin=0.4)
+                fill_cell(heat_map_img, [col, row], cell_size=CELL_SIZE, fill=color_lerp(HEAT_MAP_BASE_COLOR, HEAT_MAP_MAX_COLOR, self.heat_map[col, row]/20), margin=0.1)
+                if(self.heat_map[col, row]!=0):
+                    write_cell_text(heat_map_img, text=str(self.heat_map[col, row]), pos=[col, row], cell_size=CELL_SIZE, fill='white', margin=0.4)
         
         # Draw colonies position
         for colony_i in range(self.n_colonies):
@@ -574,38 +783,94 @@ class AntColonyEnv(gym.Env):
             write_cell_text(heat_map_img, text=str(self.initial_foodpile_capacities[foodpile_i]), pos=self.foodpile_pos[foodpile_i], cell_size=CELL_SIZE,
                                fill='white', margin=0.4)
 
-        
-        heat_map_img = np.asarray(heat_map_img)
-        if mode == 'rgb_array':
-            return heat_map_img
-        elif mode == 'human':
-            from gym.envs.classic_control import rendering
-            if self.viewer is None:
-                self.viewer = rendering.SimpleImageViewer()
-            self.viewer.imshow(heat_map_img)
-            return self.viewer.isopen
-        else:
-            raise NotImplementedError 
+        return heat_map_img
 
-    def render(self, mode='human'):
-        img = copy.copy(self._base_img)
+    def __render_raster(self):
+        # Same frame as __render_pil, drawn with array operations (text only if render_text)
+        raster = self.__raster()
+        img = raster.new_frame()
 
-        for row in range(self._grid_shape[0]):
-            for col in range(self._grid_shape[1]):
+        # Draw pheromones (only the active cells are visited)
+        rows, cols, pheromones = self.pheromones.active()
+        shown = pheromones >= self.pheromone_evaporation_rate
+        rows, cols, pheromones = rows[shown], cols[shown], pheromones[shown]
+        palette = raster.palette(GROUND_COLOR, PHEROMONE_COLOR, self.food_pheromone_intensity, pheromones.max(initial=0) + 1)
+        raster.draw_layer(img, rows, cols, palette[pheromones], texts=self.__raster_texts(pheromones))
+
+        # Agent neighborhood render
+        neighbours = (self.agent_pos[:, None] + NEIGHBOUR_OFFSETS).reshape(-1, 2)
+        valid = (neighbours >= 0).all(1) & (neighbours < self._grid_shape).all(1)
+        neighbours = np.concatenate((neighbours[valid], self.agent_pos)) # all filled with the same color, so the order does not matter
+        raster.draw_layer(img, neighbours[:, 0], neighbours[:, 1], AGENT_NEIGHBORHOOD_COLOR)
+
+        # Agent render (ants are purple when carrying food)
+        ant_colors = np.where(np.array(self.has_food)[:, None] != 0, ImageColor.getrgb(AGENT_WITH_FOOD_COLOR), AGENT_COLOR)
+        raster.draw_layer(img, self.agent_pos[:, 0], self.agent_pos[:, 1], ant_colors, shape='circle', texts=self.__raster_texts(range(1, self.n_agents + 1)))
+
+        # Foodpiles render
+        foodpiles_i = np.flatnonzero(np.logical_not(self.foodpile_depleted))
+        raster.draw_layer(img, self.foodpile_pos[foodpiles_i, 0], self.foodpile_pos[foodpiles_i, 1], ImageColor.getrgb(FOOD_COLOR),
+                          texts=self.__raster_texts(self.foodpile_capacity[foodpile_i] for foodpile_i in foodpiles_i))
+
+        # Colonies render
+        raster.draw_layer(img, self.colonies_pos[:, 0], self.colonies_pos[:, 1], ImageColor.getrgb(COLONY_COLOR),
+                          texts=self.__raster_texts(self.colonies_storage[colony_i] for colony_i in range(self.n_colonies)))
+
+        return img
+
+    def __render_heat_map_raster(self):
+        raster = self.__raster()
+        heat_map_img = raster.new_frame()
+
+        # Draw heat map values (cells in the same order as __render_heat_map_pil)
+        rows, cols = np.indices(self._grid_shape).reshape(2, -1)
+        order = np.lexsort((rows, cols))
+        rows, cols = rows[order], cols[order]
+        heat = np.asarray(self.heat_map)[rows, cols]
+        palette = raster.palette(HEAT_MAP_BASE_COLOR, HEAT_MAP_MAX_COLOR, 20, heat.max(initial=0) + 1)
+        raster.draw_layer(heat_map_img, rows, cols, palette[heat])
+        if self.render_text:
+            visited = heat != 0
+            raster.draw_layer(heat_map_img, rows[visited], cols[visited], palette[heat[visited]], texts=[str(value) for value in heat[visited]])
+
+        # Draw colonies position
+        raster.draw_layer(heat_map_img, self.colonies_pos[:, 0], self.colonies_pos[:, 1], ImageColor.getrgb(COLONY_COLOR),
+                          texts=self.__raster_texts("C" + str(colony_i) for colony_i in range(self.n_colonies)))
+
+        # Draw foodpiles position
+        raster.draw_layer(heat_map_img, self.foodpile_pos[:, 0], self.foodpile_pos[:, 1], ImageColor.getrgb(FOOD_COLOR),
+                          texts=self.__raster_texts(self.initial_foodpile_capacities[foodpile_i] for foodpile_i in range(self.n_foodpiles)))
+
+        return heat_map_img
 
-                # Draw pheromones
-                if(self.pheromones_in_grid[col][row] >= self.pheromone_evaporation_rate):
-                    pheromone_i = self.pheromones_in_grid[col][row]
-                    pheromone_pos = [col, row]
-                    fill_cell(img, pheromone_pos, cell_size=CELL_SIZE, fill=color_lerp(GROUND_COLOR, PHEROMONE_COLOR, pheromone_i/self.food_pheromone_intensity), margin=0.1)
-                    write_cell_text(img, text=str(pheromone_i), pos=pheromone_pos, cell_size=CELL_SIZE,
-                            fill='white', margin=0.4)
+    def __raster(self):
+        if self._raster is None:
+            self._raster = RasterRenderer(self._grid_shape, CELL_SIZE, GROUND_COLOR)
+        return self._raster
+
+    def __raster_texts(self, values):
+        return [str(value) for value in values] if self.render_text else None
+
+    def __frame_drawings(self):
+        # Everything render draws, grouped by cell as (order, draw function, arguments) lists
+        drawings = {}
+        order = iter(range(10 ** 9))
+
+        def draw(draw_function, pos, **kwargs):
+            drawings.setdefault((int(pos[0]), int(pos[1])), []).append((next(order), draw_function, kwargs))
+
+        # Draw pheromones (only the active cells are visited)
+        for row, col, pheromone_i in zip(*self.pheromones.active()):
+            if(pheromone_i >= self.pheromone_evaporation_rate):
+                pheromone_pos = [row, col]
+                draw(fill_cell, pheromone_pos, fill=color_lerp(GROUND_COLOR, PHEROMONE_COLOR, pheromone_i/self.food_pheromone_intensity), margin=0.1)
+                draw(write_cell_text, pheromone_pos, text=str(pheromone_i), fill='white', margin=0.4)
 
         # Agent neighborhood render
         for agent_i in range(self.n_agents):
             for neighbour in self.__get_neighbour_coordinates(self.agent_pos[agent_i]):
-                fill_cell(img, neighbour, cell_size=CELL_SIZE, fill=AGENT_NEIGHBORHOOD_COLOR, margin=0.1)
-            fill_cell(img, self.agent_pos[agent_i], cell_size=CELL_SIZE, fill=AGENT_NEIGHBORHOOD_COLOR, margin=0.1)
+                draw(fill_cell, neighbour, fill=AGENT_NEIGHBORHOOD_COLOR, margin=0.1)
+            draw(fill_cell, self.agent_pos[agent_i], fill=AGENT_NEIGHBORHOOD_COLOR, margin=0.1)
 
         # Agent render
         for agent_i in range(self.n_agents):
@@ -613,35 +878,65 @@ class AntColonyEnv(gym.Env):
             if(self.has_food[agent_i] != 0): ant_color = AGENT_WITH_FOOD_COLOR # ant is purple when carrying food
             else: ant_color = AGENT_COLOR # ant is normally black
 
-            draw_circle(img, self.agent_pos[agent_i], cell_size=CELL_SIZE, fill=ant_color)
-            write_cell_text(img, text=str(agent_i + 1), pos=self.agent_pos[agent_i], cell_size=CELL_SIZE,
-                            fill='white', margin=0.4)
+            draw(draw_circle, self.agent_pos[agent_i], fill=ant_color)
+            draw(write_cell_text, self.agent_pos[agent_i], text=str(agent_i + 1), fill='white', margin=0.4)
 
-        # Foodpiles render  
+        # Foodpiles render
         for foodpile_i in range(self.n_foodpiles):
             if (self.foodpile_depleted[foodpile_i] == False):
-                fill_cell(img, self.foodpile_pos[foodpile_i], cell_size=CELL_SIZE, fill=FOOD_COLOR, margin=0.1)
+                draw(fill_cell, self.foodpile_pos[foodpile_i], fill=FOOD_COLOR, margin=0.1)
+                draw(write_cell_text, self.foodpile_pos[foodpile_i], text=str(self.foodpile_capacity[foodpile_i]), fill='white', margin=0.4)
 
-                write_cell_text(img, text=str(self.foodpile_capacity[foodpile_i]), pos=self.foodpile_pos[foodpile_i], cell_size=CELL_SIZE,
-                               fill='white', margin=0.4)
-        
-        # Colonies render 
+        # Colonies render
         for colony_i in range(self.n_colonies):
-            fill_cell(img, self.colonies_pos[colony_i], cell_size=CELL_SIZE, fill=COLONY_COLOR, margin=0.1)
-            write_cell_text(img, text=str(self.colonies_storage[colony_i]), pos=self.colonies_pos[colony_i], cell_size=CELL_SIZE,
-                           fill='white', margin=0.4)
-
-            #write_cell_text(img, text=str(colony_i + 1), pos=self.colonies_pos[colony_i], cell_size=CELL_SIZE,
-            #               fill='white', margin=0.4)
+            draw(fill_cell, self.colonies_pos[colony_i], fill=COLONY_COLOR, margin=0.1)
+            draw(write_cell_text, self.colonies_pos[colony_i], text=str(self.colonies_storage[colony_i]), fill='white', margin=0.4)
 
+            #draw(write_cell_text, self.colonies_pos[colony_i], text=str(colony_i + 1), fill='white', margin=0.4)
 
         # UNCOMMENT TO VIEW TAGS
         #for row in range(self._grid_shape[0]):
         #    for col in range(self._grid_shape[1]):
-        #        write_cell_text(img, text=str(self._full_obs[col][row]), pos=[col, row], cell_size=CELL_SIZE,
-        #                    fill='white', margin=0.4)
+        #        draw(write_cell_text, [col, row], text=str(self._full_obs[col][row]), fill='white', margin=0.4)
+
+        return drawings
+
+    def __redraw_cell(self, img, row, col, drawings):
+        # Redraw the cell on a copy of the base image, along with the text spilling over from the cells above/left of it, then paste it back
+        canvas = self.__draw_base_img().crop(((col - 1) * CELL_SIZE, (row - 1) * CELL_SIZE, (col + 1) * CELL_SIZE, (row + 1) * CELL_SIZE))
+
+        window_drawings = [(order, draw_function, (pos_row - row + 1, pos_col - col + 1), kwargs)
+                           for pos_row in (row - 1, row) for pos_col in (col - 1, col)
+                           for order, draw_function, kwargs in drawings.get((pos_row, pos_col), ())
+                           if (pos_row, pos_col) == (row, col) or spilling_text((order, draw_function, kwargs))]
+        for _, draw_function, pos, kwargs in sorted(window_drawings, key=lambda drawing: drawing[0]):
+            draw_function(canvas, pos=pos, cell_size=CELL_SIZE, **kwargs)
+
+        img.paste(canvas.crop((CELL_SIZE, CELL_SIZE, 2 * CELL_SIZE, 2 * CELL_SIZE)), (col * CELL_SIZE, row * CELL_SIZE))
+
+    def render_heat_map(self, mode='rgb_array'):
+        if self.render_backend == 'raster':
+            heat_map_img = self.__render_heat_map_raster()
+        else:
+            heat_map_img = np.asarray(self.__render_heat_map_pil())
+
+        if mode == 'rgb_array':
+            return heat_map_img
+        elif mode == 'human':
+            from gym.envs.classic_control import rendering
+            if self.viewer is None:
+                self.viewer = rendering.SimpleImageViewer()
+            self.viewer.imshow(heat_map_img)
+            return self.viewer.isopen
+        else:
+            raise NotImplementedError 
+
+    def render(self, mode='human'):
+        if self.render_backend == 'raster':
+            img = self.__render_raster()
+        else:
+            img = np.asarray(self.__render_pil())
 
-        img = np.asarray(img)
         if mode == 'rgb_array':
             return img
         elif mode == 'human':
@@ -652,15 +947,19 @@ class AntColonyEnv(gym.Env):
             return self.viewer.isopen
         
 
-    def draw_heat_map(self, curr_episode, team):
+    def draw_heat_map(self, curr_episode, team, writer=None):
         # Check if we are in the first, middle and last episodes to save the heat map
             if(curr_episode == 0 or curr_episode == self.n_episodes/2 or curr_episode == self.n_episodes-1):
-                img_heat_map = Image.fromarray(self.render_heat_map(mode='rgb_array'))
-                img_heat_map.save('images/heat_map_' + team + '_' + str(curr_episode) + '.png')
+                # Only the rendering happens here, the PNG is encoded and written in the background (flushed on exit)
+                img_heat_map = self.render_heat_map(mode='rgb_array')
+                (writer or default_writer()).save_image(img_heat_map, 'images/heat_map_' + team + '_' + str(curr_episode) + '.png')
 
     def seed(self, n=None):
-        self.np_random, seed = seeding.np_random(n)
-        return [seed]
+        # Every random draw of the env (maps and foodpile capacities) comes from this generator
+        seed_sequence = np.random.SeedSequence(n)
+        self.np_random = np.random.Generator(np.random.PCG64(seed_sequence))
+        self._layout_seed = int(n) if isinstance(n, (int, np.integer)) else None # only int seeds key the layout cache
+        return [seed_sequence.entropy]
 
     def close(self):
         if self.viewer is not None:
@@ -698,6 +997,14 @@ ACTION_MEANING = {
     11: "COLLECT_FOOD_FROM_ANT",
 }
 
+NEIGHBOUR_OFFSETS = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]]) # down, up, right, left
+
+SPAWN_ATTEMPTS = 100 # draws tried by __spawn_batched before giving up on a map
+
+# [row, col] displacement of every action, and whether it lays pheromones (only possible while carrying food)
+MOVE_OFFSETS = np.array([[1, 0], [0, -1], [-1, 0], [0, 1], [0, 0], [1, 0], [0, -1], [-1, 0], [0, 1], [0, 0], [0, 0], [0, 0]])
+PHEROMONE_MOVES = np.isin(np.arange(len(MOVE_OFFSETS)), (5, 6, 7, 8))
+
 PRE_IDS = {
     'agent': 'A',
     'wall': 'W',
@@ -707,6 +1014,21 @@ PRE_IDS = {
     'pheromone': 'I'
 }
 
+def read_only_view(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+@functools.lru_cache(maxsize=None)
+def text_spills(text, margin):
+    # Whether text written in a cell goes past its right/bottom border
+    _, _, right, bottom = default_font().getbbox(text)
+    return int(margin * CELL_SIZE) + max(right, bottom) >= CELL_SIZE
+
+def spilling_text(drawing):
+    _, draw_function, kwargs = drawing
+    return draw_function is write_cell_text and text_spills(kwargs['text'], kwargs['margin'])
+
 def color_lerp(color_1, color_2, steps):
     color_1 = np.asarray(color_1)
     color_2 = np.asarray(color_2)
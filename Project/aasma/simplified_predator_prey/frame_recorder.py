@@ -0,0 +1,255 @@
+import json
+import os
+
+import numpy as np
+from gym import Wrapper
+from PIL import Image
+
+from aasma.simplified_predator_prey.ant_colony_env import CELL_SIZE
+
+
+class FrameRecorder(Wrapper):
+
+    """Records a compact frame of the AntColonyEnv state after every reset and step into a FrameStore on disk
+    Frames hold the agents, foodpiles, colonies and the active pheromone cells (optionally the rendered RGB frame as well),
+    and are written straight into memory-mapped files, so long runs are recorded with bounded RAM
+    """
+
+    def __init__(self, env, path, record_rgb=False):
+        super(FrameRecorder, self).__init__(env)
+        self.record_rgb = record_rgb
+        self.episode = -1
+
+        env = self.env.unwrapped
+        position_dtype = np.min_scalar_type(max(env._grid_shape))
+        fields = {
+            'episode': ((), np.int32),
+            'step': ((), np.int32),
+            'agent_pos': ((env.n_agents, 2), position_dtype),
+            'has_food': ((env.n_agents, ), np.int32), # food carried (up to foodpile_capacity_decrement)
+            'foodpile_pos': ((env.n_foodpiles, 2), position_dtype),
+            'foodpile_capacity': ((env.n_foodpiles, ), np.int32),
+            'foodpile_depleted': ((env.n_foodpiles, ), np.bool_),
+            'colonies_pos': ((env.n_colonies, 2), position_dtype),
+            'colonies_storage': ((env.n_colonies, ), np.int32),
+        }
+        if record_rgb:
+            fields['rgb'] = ((env._grid_shape[0] * CELL_SIZE, env._grid_shape[1] * CELL_SIZE, 3), np.uint8)
+
+        # One episode worth of frames to start with, the files grow when more are recorded
+        self.store = FrameStore(path, mode='w', fields=fields, capacity=env._max_steps + 1)
+
+    def reset(self, **kwargs):
+        observations = self.env.reset(**kwargs)
+        self.episode += 1
+        self.__record()
+        return observations
+
+    def step(self, action):
+        observations, rewards, dones, info = self.env.step(action)
+        self.__record()
+        return observations, rewards, dones, info
+
+    def close(self):
+        self.store.close()
+        return super(FrameRecorder, self).close()
+
+    def __record(self):
+        env = self.env.unwrapped
+        rows, cols, intensities = env.pheromones.active()
+        frame = {
+            'episode': self.episode,
+            'step': env._step_count,
+            'agent_pos': env.agent_pos,
+            'has_food': env.has_food,
+            'foodpile_pos': env.foodpile_pos,
+            'foodpile_capacity': [env.foodpile_capacity[foodpile_i] for foodpile_i in range(env.n_foodpiles)],
+            'foodpile_depleted': env.foodpile_depleted,
+            'colonies_pos': env.colonies_pos,
+            'colonies_storage': [env.colonies_storage[colony_i] for colony_i in range(env.n_colonies)],
+        }
+        if self.record_rgb:
+            frame['rgb'] = env.render(mode='rgb_array')
+
+        self.store.append(frame, rows * env._grid_shape[1] + cols, intensities, env._pheromones_tag_grid[rows, cols])
+
+
+class FrameStore:
+
+    """Frames of a run kept in a directory of raw memory-mapped files (one per field), with random access to any of them
+    Fixed size fields get one row per frame, the active pheromone cells of all frames are concatenated in three extra files
+    (flat cell index, intensity and tag), each frame pointing at its slice. mode='w' creates a store, mode='r' opens one
+    """
+
+    def __init__(self, path, mode='r', fields=None, capacity=1024):
+        self.path = path
+        self.mode = mode
+
+        if mode == 'w':
+            os.makedirs(path, exist_ok=True)
+            self.fields = {name: (tuple(shape), np.dtype(dtype).str) for name, (shape, dtype) in fields.items()}
+            self.fields.update(PHEROMONE_FIELDS)
+            self.n_frames = 0
+            self.n_pheromones = 0
+            self._columns = {name: _Column(os.path.join(path, name), shape, dtype, capacity) for name, (shape, dtype) in self.fields.items()
+                             if name not in PHEROMONE_CELL_FIELDS}
+            self._columns.update({name: _Column(os.path.join(path, name), (), self.fields[name][1], 16 * capacity) for name in PHEROMONE_CELL_FIELDS})
+            self.__write_header()
+
+        else:
+            with open(os.path.join(path, HEADER_FILE)) as header_file:
+                header = json.load(header_file)
+            self.fields = {name: (tuple(shape), dtype) for name, (shape, dtype) in header['fields'].items()}
+            self.n_frames = header['n_frames']
+            self.n_pheromones = header['n_pheromones']
+            self._columns = {name: _Column(os.path.join(path, name), shape, dtype,
+                                           self.n_pheromones if name in PHEROMONE_CELL_FIELDS else self.n_frames, mode='r')
+                             for name, (shape, dtype) in self.fields.items()}
+
+    def __len__(self):
+        return self.n_frames
+
+    def append(self, frame, pheromone_cells, pheromone_intensities, pheromone_tagged):
+        # frame maps every field to its value, pheromone_cells are flat (row * cols + col) cell indices and pheromone_tagged
+        # tells which of them are tagged in the grid (cells an agent walked over keep their pheromones but lose the tag)
+        assert self.mode == 'w', "FrameStore opened read-only."
+        frame_i, n_pheromones = self.n_frames, len(pheromone_cells)
+
+        for name, value in frame.items():
+            self._columns[name].reserve(frame_i + 1)[frame_i] = value
+        self._columns['pheromone_start'].reserve(frame_i + 1)[frame_i] = self.n_pheromones
+        self._columns['pheromone_count'].reserve(frame_i + 1)[frame_i] = n_pheromones
+
+        end = self.n_pheromones + n_pheromones
+        self._columns['pheromone_cells'].reserve(end)[self.n_pheromones:end] = pheromone_cells
+        self._columns['pheromone_intensities'].reserve(end)[self.n_pheromones:end] = pheromone_intensities
+        self._columns['pheromone_tagged'].reserve(end)[self.n_pheromones:end] = pheromone_tagged
+
+        self.n_frames, self.n_pheromones = frame_i + 1, end
+
+    def __getitem__(self, frame_i):
+        # Frame as a dict of arrays (views on the files), the pheromones as a (cells, intensities, tagged) tuple
+        if frame_i < 0:
+            frame_i += self.n_frames
+        if not 0 <= frame_i < self.n_frames:
+            raise IndexError(f"Frame {frame_i} out of range ({self.n_frames} frames).")
+
+        frame = {name: self._columns[name].array[frame_i] for name in self.fields if name not in PHEROMONE_FIELDS}
+        start, count = self._columns['pheromone_start'].array[frame_i], self._columns['pheromone_count'].array[frame_i]
+        frame['pheromones'] = tuple(self._columns[name].array[start:start + count] for name in PHEROMONE_CELL_FIELDS)
+        return frame
+
+    def restore(self, frame_i, env):
+        # Load a frame into an env built with the same arguments, e.g. to render it when no RGB frames were recorded
+        # The grid layers are rebuilt, so the env can be stepped from there (rewards, dones and heat map are not recorded)
+        frame = self[frame_i]
+        env = env.unwrapped
+
+        np.copyto(env.agent_pos, frame['agent_pos'])
+        np.copyto(env.foodpile_pos, frame['foodpile_pos'])
+        np.copyto(env.colonies_pos, frame['colonies_pos'])
+        env.has_food = frame['has_food'].tolist()
+        env.foodpile_capacity = dict(enumerate(frame['foodpile_capacity'].tolist()))
+        env.foodpile_depleted = frame['foodpile_depleted'].tolist()
+        env.colonies_storage = dict(enumerate(frame['colonies_storage'].tolist()))
+        env.foodpiles_done = all(env.foodpile_depleted)
+        env._step_count = int(frame['step'])
+
+        env.pheromones.clear()
+        cells, intensities, tagged = frame['pheromones']
+        rows, cols = np.divmod(cells, env._grid_shape[1])
+        env.pheromones.deposit_many(rows, cols, intensities)
+
+        # Depleted foodpiles are no longer in the grid
+        foodpiles = np.flatnonzero(~frame['foodpile_depleted'])
+        env._agents_grid, env._foodpiles_grid = env._new_layer(np.int16), env._new_layer(np.int16)
+        env._colonies_grid, env._pheromones_tag_grid = env._new_layer(np.int16), env._new_layer(bool)
+        env._agents_grid[env.agent_pos[:, 0], env.agent_pos[:, 1]] = np.arange(1, env.n_agents + 1)
+        env._foodpiles_grid[env.foodpile_pos[foodpiles, 0], env.foodpile_pos[foodpiles, 1]] = foodpiles + 1
+        env._colonies_grid[env.colonies_pos[:, 0], env.colonies_pos[:, 1]] = np.arange(1, env.n_colonies + 1)
+        env._pheromones_tag_grid[rows[tagged], cols[tagged]] = True
+
+    def rgb(self, frame_i, env=None):
+        # Recorded RGB frame, or the frame rendered by env (see restore)
+        if 'rgb' in self.fields:
+            return self._columns['rgb'].array[frame_i]
+
+        assert env is not None, "No RGB frames recorded, an env is needed to render them."
+        self.restore(frame_i, env)
+        return env.render(mode='rgb_array')
+
+    def save_gif(self, filename, frames=None, env=None, duration=100):
+        # frames is any iterable of frame indices (all of them by default), duration is in ms per frame
+        frames = range(self.n_frames) if frames is None else frames
+        images = (Image.fromarray(self.rgb(frame_i, env)) for frame_i in frames)
+        first = next(images)
+        first.save(filename, save_all=True, append_images=images, duration=duration, loop=0)
+
+    def flush(self):
+        if self.mode == 'w':
+            for column in self._columns.values():
+                column.flush()
+            self.__write_header()
+
+    def close(self):
+        self.flush()
+        for column in self._columns.values():
+            column.close()
+        self._columns = {}
+
+    def __write_header(self):
+        header = {'fields': self.fields, 'n_frames': self.n_frames, 'n_pheromones': self.n_pheromones}
+        with open(os.path.join(self.path, HEADER_FILE), 'w') as header_file:
+            json.dump(header, header_file)
+
+
+class _Column:
+
+    """Raw binary file mapped as a (capacity, ) + shape array, doubled in size (and remapped) whenever it is full"""
+
+    def __init__(self, filename, shape, dtype, capacity, mode='w+'):
+        self.filename = filename
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.mode = mode
+        self.array = None
+        self.__map(max(capacity, 1) if mode == 'w+' else capacity)
+
+    def reserve(self, size):
+        # Makes room for at least size rows, returns the array to write in
+        if size > len(self.array):
+            self.flush()
+            self.__map(max(size, 2 * len(self.array)))
+        return self.array
+
+    def flush(self):
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+
+    def close(self):
+        self.flush()
+        self.array = None
+
+    def __map(self, capacity):
+        row_bytes = int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+        if self.mode != 'r':
+            # Truncating to a larger size adds zeros without writing them (sparse file)
+            with open(self.filename, 'r+b' if self.array is not None else 'w+b') as column_file:
+                column_file.truncate(capacity * row_bytes)
+
+        if capacity * row_bytes == 0: # np.memmap cannot map empty files
+            self.array = np.zeros((capacity, ) + self.shape, dtype=self.dtype)
+        else:
+            self.array = np.memmap(self.filename, dtype=self.dtype, mode='r' if self.mode == 'r' else 'r+', shape=(capacity, ) + self.shape)
+
+
+HEADER_FILE = 'header.json'
+
+PHEROMONE_FIELDS = {
+    'pheromone_start': ((), np.dtype(np.int64).str),
+    'pheromone_count': ((), np.dtype(np.int32).str),
+    'pheromone_cells': ((), np.dtype(np.int64).str),
+    'pheromone_intensities': ((), np.dtype(np.int32).str),
+    'pheromone_tagged': ((), np.dtype(np.bool_).str),
+}
+PHEROMONE_CELL_FIELDS = ('pheromone_cells', 'pheromone_intensities', 'pheromone_tagged')
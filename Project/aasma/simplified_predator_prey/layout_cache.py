@@ -0,0 +1,37 @@
+from collections import OrderedDict
+
+
+class LayoutCache:
+
+    """Initial states of AntColonyEnv episodes, keyed by the seed they were generated from and the env config
+    An env built with layout_cache= stores the state of every reset that follows seed(n) (n an int), and restores it
+    with set_state the next time it is seeded with n, so replaying a map (e.g. once per team) skips its generation.
+    One cache can be shared by several envs, the least recently used layouts are dropped beyond max_layouts
+    """
+
+    def __init__(self, max_layouts=1024):
+        self.max_layouts = max_layouts
+        self._layouts = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def __len__(self):
+        return len(self._layouts)
+
+    def get(self, key):
+        state = self._layouts.get(key)
+        if state is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._layouts.move_to_end(key)
+        return state
+
+    def put(self, key, state):
+        self._layouts[key] = state
+        self._layouts.move_to_end(key)
+        while len(self._layouts) > self.max_layouts:
+            self._layouts.popitem(last=False)
+
+    def clear(self):
+        self._layouts.clear()
+        self.hits, self.misses = 0, 0
@@ -0,0 +1,135 @@
+import numpy as np
+
+
+class DensePheromones:
+
+    """Pheromone intensity of every cell of the grid, cheapest for small maps"""
+
+    def __init__(self, grid_shape):
+        self.grid_shape = grid_shape
+        self.grid = np.zeros(grid_shape, dtype=np.int32)
+
+    def clear(self):
+        self.grid[:] = 0
+
+    def deposit(self, row, col, intensity):
+        self.grid[row, col] += intensity # currently stacks pheromones
+
+    def deposit_many(self, rows, cols, intensity):
+        np.add.at(self.grid, (rows, cols), intensity)
+
+    def evaporate(self, rate):
+        # Every cell holding pheromones loses the evaporation rate, and the ones left below it are cleared (returned as rows, cols)
+        active = self.grid > 0
+        self.grid[active] -= rate
+
+        evaporated = active & (self.grid < rate)
+        self.grid[evaporated] = 0
+        return np.nonzero(evaporated)
+
+    def values(self, rows, cols):
+        return self.grid[rows, cols]
+
+    def active(self):
+        rows, cols = np.nonzero(self.grid)
+        return rows, cols, self.grid[rows, cols]
+
+    def to_dense(self):
+        # Read-only like the grid built by SparsePheromones, the store is only changed through its methods
+        grid = self.grid.view()
+        grid.flags.writeable = False
+        return grid
+
+    def get_state(self):
+        return self.grid.copy()
+
+    def set_state(self, state):
+        np.copyto(self.grid, state)
+
+
+class SparsePheromones:
+
+    """Pheromone intensity of the active cells only, kept as sorted flat cell indices and their intensities
+    Evaporation, deposits and lookups cost O(active cells) instead of O(grid area), for large maps that are mostly empty
+    """
+
+    def __init__(self, grid_shape):
+        self.grid_shape = grid_shape
+        self.cells = np.zeros(0, dtype=np.int64)
+        self.intensities = np.zeros(0, dtype=np.int32)
+
+        # Deposits since the last read, merged into the arrays above at once
+        self._pending_cells = []
+        self._pending_intensities = []
+
+    def clear(self):
+        self.cells = self.cells[:0]
+        self.intensities = self.intensities[:0]
+        self._pending_cells.clear()
+        self._pending_intensities.clear()
+
+    def deposit(self, row, col, intensity):
+        self._pending_cells.append(row * self.grid_shape[1] + col)
+        self._pending_intensities.append(intensity)
+
+    def deposit_many(self, rows, cols, intensity):
+        cells = np.asarray(rows) * self.grid_shape[1] + np.asarray(cols)
+        self._pending_cells.extend(cells.tolist())
+        self._pending_intensities.extend(np.broadcast_to(intensity, cells.shape).tolist())
+
+    def evaporate(self, rate):
+        # Same as DensePheromones.evaporate, on the active cells only
+        self.__merge_pending()
+        self.intensities -= rate
+
+        evaporated = self.intensities < rate
+        evaporated_cells = self.cells[evaporated]
+        self.cells = self.cells[~evaporated]
+        self.intensities = self.intensities[~evaporated]
+        return np.divmod(evaporated_cells, self.grid_shape[1])
+
+    def values(self, rows, cols):
+        self.__merge_pending()
+        if len(self.cells) == 0:
+            return np.zeros(np.shape(rows), dtype=self.intensities.dtype)
+
+        cells = rows * self.grid_shape[1] + cols
+        i = np.searchsorted(self.cells, cells).clip(max=len(self.cells) - 1)
+        return np.where(self.cells[i] == cells, self.intensities[i], 0)
+
+    def active(self):
+        self.__merge_pending()
+        rows, cols = np.divmod(self.cells, self.grid_shape[1])
+        return rows, cols, self.intensities
+
+    def to_dense(self):
+        self.__merge_pending()
+        grid = np.zeros(self.grid_shape, dtype=self.intensities.dtype)
+        grid.reshape(-1)[self.cells] = self.intensities
+        grid.flags.writeable = False
+        return grid
+
+    def get_state(self):
+        self.__merge_pending()
+        return self.cells.copy(), self.intensities.copy()
+
+    def set_state(self, state):
+        self.clear()
+        self.cells, self.intensities = state[0].copy(), state[1].copy()
+
+    def __merge_pending(self):
+        if not self._pending_cells:
+            return
+
+        # Deposits on the same cell stack, as in DensePheromones
+        cells, inverse = np.unique(np.concatenate((self.cells, self._pending_cells)), return_inverse=True)
+        intensities = np.zeros(len(cells), dtype=self.intensities.dtype)
+        np.add.at(intensities, inverse, np.concatenate((self.intensities, self._pending_intensities)).astype(self.intensities.dtype))
+
+        self.cells, self.intensities = cells, intensities
+        self._pending_cells.clear()
+        self._pending_intensities.clear()
+
+
+# Maps with at least this many cells keep their pheromones in a SparsePheromones store by default
+SPARSE_PHEROMONES_MIN_CELLS = 128 * 128
@@ -0,0 +1,107 @@
+import functools
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from ma_gym.envs.utils.draw import draw_grid, fill_cell, draw_circle
+
+
+class RasterRenderer:
+
+    """Draws frames straight into (rows * cell_size, cols * cell_size, 3) uint8 arrays
+    Shapes are block assignments over every cell of a kind at once, using pixel masks and text stamps drawn once with the PIL
+    helpers, so frames match the PIL ones pixel for pixel
+    """
+
+    def __init__(self, grid_shape, cell_size, ground_color):
+        self.grid_shape = grid_shape
+        self.cell_size = cell_size
+        self._base = np.asarray(draw_grid(grid_shape[0], grid_shape[1], cell_size=cell_size, fill=ground_color))
+
+        # Pixels covered by each shape inside a cell
+        self._masks = {'fill': _cell_mask(fill_cell, cell_size, margin=0.1), 'circle': _cell_mask(draw_circle, cell_size)}
+
+        self._palettes = {}
+        self._text_stamps = {} # per renderer, so the cache goes away with it
+
+    def new_frame(self):
+        return self._base.copy()
+
+    def palette(self, color_1, color_2, scale, size):
+        # Lookup table with the color of color_lerp(color_1, color_2, i / scale) for every i < size, clipped like PIL does
+        key = (color_1, color_2, scale)
+        if key not in self._palettes or len(self._palettes[key]) < size:
+            steps = np.arange(max(size, 64, 2 * len(self._palettes.get(key, ()))))[:, None] / scale
+            colors = np.asarray(color_1) * (1 - steps) + np.asarray(color_2) * steps
+            self._palettes[key] = np.trunc(colors).clip(0, 255).astype(np.uint8)
+
+        return self._palettes[key]
+
+    def draw_layer(self, frame, rows, cols, colors, shape='fill', texts=None, text_color=(255, 255, 255)):
+        # Draw a shape (and optionally a text) on each (row, col) cell, in order, colors is one color or one per cell
+        colors = np.broadcast_to(np.asarray(colors, dtype=np.uint8), (len(rows), 3))
+
+        # Texts spilling over other cells have to be interleaved with the shapes, as the PIL helpers draw them
+        if texts is not None and any(self.__text_stamp(text)[2] for text in texts):
+            for i, (row, col, text) in enumerate(zip(rows, cols, texts)):
+                self.draw_layer(frame, rows[i:i + 1], cols[i:i + 1], colors[i:i + 1], shape)
+                self.draw_text(frame, row, col, text, text_color)
+            return
+
+        if len(rows) > 0:
+            blocks = frame.reshape(self.grid_shape[0], self.cell_size, self.grid_shape[1], self.cell_size, 3)
+            mask = self._masks[shape]
+
+            (top, bottom), (left, right) = [(np.flatnonzero(covered)[0], np.flatnonzero(covered)[-1] + 1) for covered in (mask.any(1), mask.any(0))]
+            if mask[top:bottom, left:right].all(): # rectangle
+                blocks[rows, top:bottom, cols, left:right] = colors[:, None, None]
+            else:
+                blocks[rows, :, cols, :] = np.where(mask[None, :, :, None], colors[:, None, None], blocks[rows, :, cols, :])
+
+        for row, col, text in zip(rows, cols, texts if texts is not None else ()):
+            self.draw_text(frame, row, col, text, text_color)
+
+    def draw_text(self, frame, row, col, text, color=(255, 255, 255)):
+        # Blend the text stamp into the frame with the same rounding as PIL
+        (top, left), alpha, _ = self.__text_stamp(text)
+        top, left = row * self.cell_size + top, col * self.cell_size + left
+        alpha = alpha[:frame.shape[0] - top, :frame.shape[1] - left, None]
+
+        region = frame[top:top + alpha.shape[0], left:left + alpha.shape[1]]
+        blended = region * (255 - alpha) + np.asarray(color, dtype=np.int32) * alpha + 128
+        region[:] = (blended + (blended >> 8)) >> 8
+
+    def __text_stamp(self, text):
+        # Offset (from the cell corner), opacity and whether it spills out of the cell, of the text drawn by write_cell_text
+        stamp = self._text_stamps.get(text)
+        if stamp is None:
+            stamp = self._text_stamps[text] = self.__draw_text_stamp(text)
+        return stamp
+
+    def __draw_text_stamp(self, text):
+        canvas = Image.new('L', ((len(text) + 2) * self.cell_size, 2 * self.cell_size))
+        write_cell_text(canvas, text, [0, 0], cell_size=self.cell_size, fill=255, margin=0.4)
+        alpha = np.asarray(canvas).astype(np.int32)
+
+        if not alpha.any():
+            return (0, 0), alpha[:0, :0], False
+
+        rows, cols = np.flatnonzero(alpha.any(1)), np.flatnonzero(alpha.any(0))
+        alpha = alpha[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        return (rows[0], cols[0]), alpha, rows[-1] >= self.cell_size or cols[-1] >= self.cell_size
+
+
+@functools.lru_cache(maxsize=None)
+def default_font():
+    return ImageFont.load_default()
+
+def write_cell_text(image, text, pos, cell_size=None, fill='black', margin=0):
+    # Same as ma_gym's write_cell_text, without loading the default font on every call
+    col, row = pos
+    x, y = row * cell_size + margin * cell_size, col * cell_size + margin * cell_size
+    ImageDraw.Draw(image).text((x, y), text=text, fill=fill, font=default_font())
+
+def _cell_mask(draw_function, cell_size, **kwargs):
+    canvas = Image.new('L', (cell_size, cell_size))
+    draw_function(canvas, [0, 0], cell_size=cell_size, fill=255, **kwargs)
+    return np.asarray(canvas) > 0
@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+
+
+class StepProfiler:
+
+    """Time spent in each phase of AntColonyEnv.step, as call counts, totals and log-scale histograms (in ns)
+    The env calls start() at the beginning of a step and lap(phase) at the end of each phase, phases being STEP_PHASES indices
+    """
+
+    def __init__(self, phases=None):
+        self.phases = STEP_PHASES if phases is None else phases
+        self.reset()
+
+    def reset(self):
+        # Plain lists, cheaper to update from Python than numpy arrays
+        self.calls = [0] * len(self.phases)
+        self.total_ns = [0] * len(self.phases)
+        self.histograms = [[0] * HISTOGRAM_BUCKETS for _ in self.phases] # 4 buckets per power of two (see _bucket)
+        self.last_step = {}
+        self._last = 0
+
+    def start(self):
+        self.last_step = {}
+        self._last = time.perf_counter_ns()
+
+    def lap(self, phase):
+        now = time.perf_counter_ns()
+        elapsed = now - self._last
+        self._last = now
+
+        self.calls[phase] += 1
+        self.total_ns[phase] += elapsed
+        self.histograms[phase][_bucket(elapsed)] += 1
+        self.last_step[self.phases[phase]] = elapsed
+
+    def stats(self):
+        # Per phase: calls, total and mean time, and percentiles (upper bounds of the histogram buckets they fall in)
+        stats = {}
+        for phase_i, phase in enumerate(self.phases):
+            if self.calls[phase_i] == 0:
+                continue
+
+            cumulative = np.cumsum(self.histograms[phase_i]) / self.calls[phase_i]
+            percentile = lambda q: float(BUCKET_UPPER_BOUNDS_NS[np.searchsorted(cumulative, q)]) / 1e3
+            stats[phase] = {
+                'calls': self.calls[phase_i],
+                'total_ms': self.total_ns[phase_i] / 1e6,
+                'mean_us': self.total_ns[phase_i] / self.calls[phase_i] / 1e3,
+                'p50_us': percentile(0.5),
+                'p90_us': percentile(0.9),
+                'p99_us': percentile(0.99),
+            }
+        return stats
+
+
+def _bucket(ns):
+    # Histogram bucket of a duration: its power of two and the 2 bits after the leading one (buckets are at most 25% wide)
+    bits = ns.bit_length()
+    if bits <= 3:
+        return ns
+    return min(4 * bits - 8 + ((ns >> (bits - 3)) & 3), HISTOGRAM_BUCKETS - 1)
+
+
+HISTOGRAM_BUCKETS = 256
+
+# Largest duration falling in each bucket
+BUCKET_UPPER_BOUNDS_NS = np.array([bucket if bucket < 8 else ((5 + bucket % 4) << (bucket // 4 - 1)) - 1 for bucket in range(HISTOGRAM_BUCKETS)], dtype=float)
+
+STEP_PHASES = (
+    'penalty_heat_map',
+    'evaporation',
+    'transfers',
+    'moves',
+    'foodpiles',
+    'colonies',
+    'termination',
+    'get_agent_obs',
+    'simplified_features',
+    'format_outgoing_observations',
+)
+PENALTY_HEAT_MAP, EVAPORATION, TRANSFERS, MOVES, FOODPILES, COLONIES, TERMINATION, \
+    GET_AGENT_OBS, SIMPLIFIED_FEATURES, FORMAT_OUTGOING_OBSERVATIONS = range(len(STEP_PHASES))
@@ -0,0 +1,202 @@
+import multiprocessing as mp
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from aasma.simplified_predator_prey.ant_colony_env import AntColonyEnv, read_only_view
+
+
+class SubprocVecAntColonyEnv:
+
+    """Several AntColonyEnv instances stepped in lockstep by worker processes
+    Actions, observations, rewards, dones and infos are exchanged through shared memory arrays, and workers are woken up with
+    semaphores, so a step never pickles anything. Same interface as VecAntColonyEnv (finished environments reset automatically)
+    """
+
+    def __init__(self, n_envs=8, n_workers=None, copy_observations=False, **env_kwargs):
+        assert not env_kwargs.get('full_observable', False), "SubprocVecAntColonyEnv only supports partially observable agents."
+
+        # Only used for the spaces and the observation shape
+        template = AntColonyEnv(**env_kwargs)
+
+        self.n_envs = n_envs
+        self.n_workers = min(n_workers or mp.cpu_count(), n_envs)
+        self.n_agents = template.n_agents
+        self.action_space = template.action_space
+        self.observation_space = template.observation_space
+        self.copy_observations = copy_observations
+
+        # Arrays shared with the workers (each worker only writes the rows of its own environments)
+        obs_shape = (n_envs, ) + template._outgoing_observations.shape
+        self._shared_specs = {
+            'actions': ((n_envs, self.n_agents), np.int64),
+            'observations': (obs_shape, np.float64),
+            'final_observations': (obs_shape, np.float64),
+            'rewards': ((n_envs, self.n_agents), np.float64),
+            'dones': ((n_envs, self.n_agents), np.bool_),
+            'foodpiles_done': ((n_envs, ), np.bool_),
+            'colony_storage': ((n_envs, ), np.int64),
+            'seeds': ((n_envs, ), np.int64),
+            'commands': ((self.n_workers, ), np.int64),
+            'errors': ((self.n_workers, ), np.bool_),
+        }
+        self._shared_memory, self._shared = {}, {}
+        for key, (shape, dtype) in self._shared_specs.items():
+            self._shared_memory[key], self._shared[key] = _shared_array(shape, dtype)
+        shared_names = {key: shm.name for key, shm in self._shared_memory.items()}
+
+        # Every worker owns a contiguous block of environments
+        self._start = [mp.Semaphore(0) for _ in range(self.n_workers)]
+        self._finished = mp.Semaphore(0)
+        self._workers = []
+        for worker_i, env_ids in enumerate(np.array_split(np.arange(n_envs), self.n_workers)):
+            worker = mp.Process(target=_worker, daemon=True,
+                                args=(worker_i, env_ids, env_kwargs, self._shared_specs, shared_names, self._start[worker_i], self._finished))
+            worker.start()
+            self._workers.append(worker)
+
+        self.closed = False
+        self.broken = False # a worker died, the others may still answer the abandoned command so only close() is allowed
+
+    def seed(self, n=None):
+        # Environment i is seeded with n + i, as in VecAntColonyEnv (n=None draws a random seed per environment)
+        seeds = np.random.SeedSequence(n).generate_state(self.n_envs, dtype=np.uint32) if n is None else n + np.arange(self.n_envs)
+        self.__check_usable()
+        self._shared['seeds'][:] = seeds
+        self.__run(SEED)
+        return list(self._shared['seeds'])
+
+    def reset(self):
+        self.__run(RESET)
+        return self.__outgoing_observations()
+
+    def step(self, agents_action):
+        self.__check_usable()
+        self._shared['actions'][:] = agents_action
+        self.__run(STEP)
+
+        dones = self._shared['dones'].copy()
+        infos = {
+            'foodpiles_done': self._shared['foodpiles_done'].copy(),
+            'colony_storage': self._shared['colony_storage'].copy(),
+            'final_observation': {env_i: self._shared['final_observations'][env_i].copy() for env_i in np.flatnonzero(dones[:, 0])},
+        }
+
+        return self.__outgoing_observations(), self._shared['rewards'].copy(), dones, infos
+
+    def close(self):
+        if self.closed:
+            return
+
+        # The shared memory is released even if a worker failed or died (the others are then stopped right away)
+        try:
+            if not self.broken:
+                self.__run(CLOSE)
+        finally:
+            for worker in self._workers:
+                worker.join(timeout=0 if self.broken else WORKER_TIMEOUT)
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+
+            self._shared.clear()
+            for shm in self._shared_memory.values():
+                shm.close()
+                shm.unlink()
+
+            self.closed = True
+
+    def __run(self, command):
+        # Wake up every worker and wait until all of them are done (errors only come from this command)
+        self.__check_usable()
+        self._shared['errors'][:] = False
+        self._shared['commands'][:] = command
+        for start in self._start:
+            start.release()
+        for _ in range(self.n_workers):
+            while not self._finished.acquire(timeout=WORKER_TIMEOUT):
+                # Workers only exit (cleanly) after a CLOSE, any other exit means the worker died and will never answer
+                dead = [worker_i for worker_i, worker in enumerate(self._workers)
+                        if not worker.is_alive() and (command != CLOSE or worker.exitcode != 0)]
+                if dead:
+                    self.broken = True
+                    raise RuntimeError(f"Worker(s) {dead} died (exit codes {[self._workers[worker_i].exitcode for worker_i in dead]}).")
+
+        if self._shared['errors'].any():
+            raise RuntimeError(f"Worker(s) {np.flatnonzero(self._shared['errors']).tolist()} failed, see the traceback above.")
+
+    def __check_usable(self):
+        if self.closed or self.broken:
+            raise RuntimeError("SubprocVecAntColonyEnv closed." if self.closed else "A worker of this SubprocVecAntColonyEnv died, it can only be closed.")
+
+    def __outgoing_observations(self):
+        if self.copy_observations:
+            return self._shared['observations'].copy()
+
+        return read_only_view(self._shared['observations']) # overwritten by the next reset/step
+
+
+def _shared_array(shape, dtype, name=None):
+    size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _worker(worker_i, env_ids, env_kwargs, shared_specs, shared_names, start, finished):
+    shared_memory_blocks, shared = {}, {}
+    for key, (shape, dtype) in shared_specs.items():
+        shared_memory_blocks[key], shared[key] = _shared_array(shape, dtype, name=shared_names[key])
+
+    envs = {env_i: AntColonyEnv(**env_kwargs) for env_i in env_ids}
+
+    while True:
+        start.acquire()
+        command = shared['commands'][worker_i]
+
+        try:
+            if command == SEED:
+                for env_i, env in envs.items():
+                    env.seed(int(shared['seeds'][env_i]))
+
+            elif command == RESET:
+                for env_i, env in envs.items():
+                    shared['observations'][env_i] = env.reset()
+
+            elif command == STEP:
+                for env_i, env in envs.items():
+                    observations, rewards, dones, info = env.step(shared['actions'][env_i])
+
+                    shared['rewards'][env_i] = rewards
+                    shared['dones'][env_i] = dones
+                    shared['foodpiles_done'][env_i] = info['foodpiles_done']
+                    shared['colony_storage'][env_i] = info['colony_storage']
+
+                    # Reset finished environments, keeping their last observations
+                    if all(dones):
+                        shared['final_observations'][env_i] = observations
+                        observations = env.reset()
+
+                    shared['observations'][env_i] = observations
+
+            elif command == CLOSE:
+                for env in envs.values():
+                    env.close()
+
+        except Exception:
+            traceback.print_exc()
+            shared['errors'][worker_i] = True
+
+        finished.release()
+
+        if command == CLOSE:
+            break
+
+    shared.clear()
+    for shm in shared_memory_blocks.values():
+        shm.close()
+
+
+SEED, RESET, STEP, CLOSE = range(4)
+
+WORKER_TIMEOUT = 1 # seconds between checks that the workers are still alive
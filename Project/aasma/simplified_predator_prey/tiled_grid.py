@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class TiledGrid:
+
+    """2D grid layer split into square tiles, only allocated once a non-zero value is written in them
+    Indexed like a numpy array with [row, col] (ints or integer arrays), so memory follows the touched area of huge maps
+    """
+
+    def __init__(self, shape, dtype, tile_size=64):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.tile_size = tile_size
+
+        # Id of the tile covering each block of the grid, tile 0 is never written (it stands for every unallocated tile)
+        self._tile_ids = np.zeros((-(-self.shape[0] // tile_size), -(-self.shape[1] // tile_size)), dtype=np.int32)
+        self._tiles = np.zeros((8, tile_size, tile_size), dtype=self.dtype)
+        self.n_tiles = 1
+
+    def __getitem__(self, key):
+        rows, cols = key
+        tiles = self._tile_ids[rows // self.tile_size, cols // self.tile_size]
+        return self._tiles[tiles, rows % self.tile_size, cols % self.tile_size]
+
+    def __setitem__(self, key, values):
+        rows, cols = key
+
+        # Single cell (most writes)
+        if isinstance(rows, (int, np.integer)) and isinstance(cols, (int, np.integer)):
+            tile = self._tile_ids[rows // self.tile_size, cols // self.tile_size]
+            if tile == 0:
+                if not values:
+                    return
+                tile = self.__allocate(np.array([rows // self.tile_size]), np.array([cols // self.tile_size]))[0]
+            self._tiles[tile, rows % self.tile_size, cols % self.tile_size] = values
+            return
+
+        rows, cols = np.broadcast_arrays(rows, cols)
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), rows.shape)
+        tile_rows, tile_cols = rows // self.tile_size, cols // self.tile_size
+
+        missing = (self._tile_ids[tile_rows, tile_cols] == 0) & (values != 0)
+        if missing.any():
+            self.__allocate(tile_rows[missing], tile_cols[missing])
+
+        # Zeros written on unallocated tiles change nothing
+        tiles = self._tile_ids[tile_rows, tile_cols]
+        written = tiles != 0
+        self._tiles[tiles[written], rows[written] % self.tile_size, cols[written] % self.tile_size] = values[written]
+
+    def __array__(self, dtype=None, copy=None):
+        # Dense copy of the whole grid (debugging/rendering only)
+        grid = np.zeros((self._tile_ids.shape[0] * self.tile_size, self._tile_ids.shape[1] * self.tile_size), dtype=dtype or self.dtype)
+        for tile_row, tile_col in np.argwhere(self._tile_ids):
+            grid[tile_row * self.tile_size:(tile_row + 1) * self.tile_size, tile_col * self.tile_size:(tile_col + 1) * self.tile_size] = \
+                self._tiles[self._tile_ids[tile_row, tile_col]]
+        return grid[:self.shape[0], :self.shape[1]]
+
+    def copy(self):
+        grid = TiledGrid.__new__(TiledGrid)
+        grid.shape, grid.dtype, grid.tile_size = self.shape, self.dtype, self.tile_size
+        grid._tile_ids = self._tile_ids.copy()
+        grid._tiles = self._tiles[:self.n_tiles].copy()
+        grid.n_tiles = self.n_tiles
+        return grid
+
+    @property
+    def nbytes(self):
+        return self._tile_ids.nbytes + self.n_tiles * self._tiles[0].nbytes
+
+    def __allocate(self, tile_rows, tile_cols):
+        # Give a new tile to every (tile_row, tile_col) block without one, returns the tile ids of all of them
+        blocks = np.unique(np.stack((tile_rows, tile_cols), axis=1), axis=0)
+        new_blocks = blocks[self._tile_ids[blocks[:, 0], blocks[:, 1]] == 0]
+
+        if self.n_tiles + len(new_blocks) > len(self._tiles):
+            tiles = np.zeros((max(2 * len(self._tiles), self.n_tiles + len(new_blocks)), self.tile_size, self.tile_size), dtype=self.dtype)
+            tiles[:self.n_tiles] = self._tiles[:self.n_tiles]
+            self._tiles = tiles
+
+        self._tile_ids[new_blocks[:, 0], new_blocks[:, 1]] = np.arange(self.n_tiles, self.n_tiles + len(new_blocks))
+        self.n_tiles += len(new_blocks)
+        return self._tile_ids[tile_rows, tile_cols]
+
+
+# Maps with at least this many cells keep their grid layers in TiledGrids by default
+TILED_WORLD_MIN_CELLS = 1024 * 1024
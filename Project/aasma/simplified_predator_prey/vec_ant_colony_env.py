@@ -0,0 +1,302 @@
+import numpy as np
+
+from aasma.simplified_predator_prey.ant_colony_env import AntColonyEnv, ACTION_MEANING, NEIGHBOUR_OFFSETS, read_only_view
+
+
+class VecAntColonyEnv:
+
+    """Several independent AntColonyEnv episodes stepped together as one batched array state
+    Every layer, position and counter gets a leading environment axis (B), so a step costs one loop over the agents,
+    foodpiles and colonies of a single map, each vectorized over the B maps. Finished environments are reset automatically
+    That fixed per-step cost is only amortized over large batches: on a 16x16 map with 4 ants (one core), throughput is
+    about 3x that of a single AntColonyEnv with 16 envs, 9x with 64, 16x with 256 and 21x with 1024
+    """
+
+    def __init__(self, n_envs=8, copy_observations=False, **env_kwargs):
+        assert not env_kwargs.get('full_observable', False), "VecAntColonyEnv only supports partially observable agents."
+        assert not env_kwargs.get('batched_moves', False), "VecAntColonyEnv resolves moves agent by agent, like the default AntColonyEnv."
+        assert env_kwargs.get('layout_cache') is None, "VecAntColonyEnv generates its maps from its own streams, not from seeds."
+
+        # Template env, used to generate the initial state of every episode (so layouts match AntColonyEnv's)
+        self._template = AntColonyEnv(**env_kwargs)
+
+        self.n_envs = n_envs
+        self.n_agents = self._template.n_agents
+        self.n_foodpiles = self._template.n_foodpiles
+        self.n_colonies = self._template.n_colonies
+        self.action_space = self._template.action_space
+        self.observation_space = self._template.observation_space
+
+        self._grid_shape = self._template._grid_shape
+        self._max_steps = self._template._max_steps
+        self._penalty = self._template._penalty
+        self._step_cost = self._template._step_cost
+        self._env_ids = np.arange(self.n_envs)
+
+        grid_shape = (self.n_envs, ) + tuple(self._grid_shape)
+
+        # Grid layers (see AntColonyEnv), one per environment
+        self._agents_grid = np.zeros(grid_shape, dtype=np.int16)
+        self._foodpiles_grid = np.zeros(grid_shape, dtype=np.int16)
+        self._colonies_grid = np.zeros(grid_shape, dtype=np.int16)
+        self._pheromones_tag_grid = np.zeros(grid_shape, dtype=bool)
+        self.pheromones_in_grid = np.zeros(grid_shape, dtype=np.int32)
+        self.heat_map = np.zeros(grid_shape, dtype=np.int32)
+
+        # Entities
+        self.agent_pos = np.zeros((self.n_envs, self.n_agents, 2), dtype=int)
+        self.has_food = np.zeros((self.n_envs, self.n_agents), dtype=int)
+        self.foodpile_pos = np.zeros((self.n_envs, self.n_foodpiles, 2), dtype=int)
+        self.foodpile_capacity = np.zeros((self.n_envs, self.n_foodpiles), dtype=int)
+        self.foodpile_depleted = np.zeros((self.n_envs, self.n_foodpiles), dtype=bool)
+        self.colonies_pos = np.zeros((self.n_envs, self.n_colonies, 2), dtype=int)
+        self.colonies_storage = np.zeros((self.n_envs, self.n_colonies), dtype=int)
+
+        self._step_count = np.zeros(self.n_envs, dtype=int)
+        self._total_episode_reward = np.zeros((self.n_envs, self.n_agents))
+
+        # Observations returned by reset/step, laid out as in AntColonyEnv.format_outgoing_observations
+        self.copy_observations = copy_observations
+        self._outgoing_observations = np.zeros((self.n_envs, ) + self._template._outgoing_observations.shape)
+
+        self.seed()
+
+    def seed(self, n=None):
+        # Environment i draws its maps from its own stream, as an AntColonyEnv seeded with n + i would
+        self._np_randoms, seeds = [], []
+        for env_i in range(self.n_envs):
+            seeds += self._template.seed(None if n is None else n + env_i)
+            self._np_randoms.append(self._template.np_random)
+        return seeds
+
+    def reset(self):
+        for env_i in range(self.n_envs):
+            self.__reset_env(env_i)
+
+        return self.__format_outgoing_observations()
+
+    def step(self, agents_action):
+        agents_action = np.asarray(agents_action)
+        if np.any((agents_action < 0) | (agents_action >= len(ACTION_MEANING))):
+            raise Exception('Action Not found!')
+
+        envs = self._env_ids
+        self._step_count += 1
+        rewards = np.full((self.n_envs, self.n_agents), self._step_cost)
+
+        # Small penalty for dumb behavior (dropping food without having any)
+        rewards[(agents_action == 10) & (self.has_food == 0)] += self._penalty
+
+        # Update heat map with current agent pos
+        self.heat_map[envs[:, None], self.agent_pos[:, :, 0], self.agent_pos[:, :, 1]] += 1
+
+        # Decrease intensity of pheromones
+        self.__evaporate_pheromones()
+
+        # Ants collecting food from ants next to them which carry the maximum amount
+        if np.any((agents_action == 11) & (self.has_food == 0)):
+            agents_neighbours = self._neighbour_agents_batch(self.agent_pos)
+
+            for agent_i in range(self.n_agents):
+                searching = (agents_action[:, agent_i] == 11) & (self.has_food[:, agent_i] == 0)
+
+                for other_agent_i in agents_neighbours[:, agent_i].T:
+                    found = searching & (other_agent_i >= 0) & (self.has_food[envs, other_agent_i] == 2)
+                    self.has_food[found, agent_i] = 1
+                    self.has_food[envs[found], other_agent_i[found]] = 1
+                    searching &= ~found
+
+        # Agents move one after the other, as in AntColonyEnv
+        for agent_i in range(self.n_agents):
+            self.__update_agent_pos(agent_i, agents_action[:, agent_i])
+
+        # Update foodpiles
+        foodpiles_neighbours = self._neighbour_agents_batch(self.foodpile_pos)
+        for foodpile_i in range(self.n_foodpiles):
+            available = ~self.foodpile_depleted[:, foodpile_i]
+
+            for agent_i in foodpiles_neighbours[:, foodpile_i].T:
+                collecting = available & (agent_i >= 0) & (self.has_food[envs, agent_i] == 0) & (agents_action[envs, agent_i] == 9)
+                if not collecting.any():
+                    continue
+
+                collecting_envs, collecting_agents = envs[collecting], agent_i[collecting]
+
+                # Reduce foodpile capacity
+                self.foodpile_capacity[collecting_envs, foodpile_i] -= self._template.foodpile_capacity_decrement
+
+                depleted = collecting & (self.foodpile_capacity[:, foodpile_i] < 1)
+                self.foodpile_depleted[depleted, foodpile_i] = True
+                self._foodpiles_grid[envs[depleted], self.foodpile_pos[depleted, foodpile_i, 0], self.foodpile_pos[depleted, foodpile_i, 1]] = 0
+
+                # Rewards agent which got food and signal flag
+                rewards[collecting_envs, collecting_agents] += self._template.foodpile_capture_reward
+                self.has_food[collecting_envs, collecting_agents] = self._template.foodpile_capacity_decrement
+
+        # Update colonies storage
+        colonies_neighbours = self._neighbour_agents_batch(self.colonies_pos)
+        for colony_i in range(self.n_colonies):
+
+            # AntColonyEnv only checks the last agent found around the colony (-1 if there is none)
+            neighbours = colonies_neighbours[:, colony_i]
+            agent_i = neighbours[envs, neighbours.shape[1] - 1 - np.argmax(neighbours[:, ::-1] >= 0, axis=1)]
+
+            dropping = (agent_i >= 0) & (self.has_food[envs, agent_i] != 0) & (agents_action[envs, agent_i] == 10)
+            dropping_envs, dropping_agents = envs[dropping], agent_i[dropping]
+
+            self.colonies_storage[dropping_envs, colony_i] += self.has_food[dropping_envs, dropping_agents] * 10
+            rewards[dropping_envs, dropping_agents] += self._template.colonies_deposit_reward
+            self.has_food[dropping_envs, dropping_agents] = 0
+
+            self.colonies_storage[self.colonies_storage[:, colony_i] > 1, colony_i] -= self._template.colonies_storage_decrement
+
+        # Same stopping rules as AntColonyEnv (whose colony check tests the colony ids, so it only triggers with more than one colony)
+        foodpiles_done = self.foodpile_depleted.all(axis=1)
+        done = (self._step_count >= self._max_steps) | (foodpiles_done & ~self.has_food.any(axis=1)) | (self.n_colonies > 1)
+        dones = np.repeat(done[:, None], self.n_agents, axis=1)
+
+        self._total_episode_reward += rewards
+
+        infos = {'foodpiles_done': foodpiles_done, 'colony_storage': self.colonies_storage[:, 0].copy(), 'final_observation': {}}
+
+        observations = self.__format_outgoing_observations()
+
+        # Reset finished environments, keeping their last observations in infos (copied at once, before the resets)
+        if done.any():
+            infos['final_observation'] = dict(zip(envs[done].tolist(), self._outgoing_observations[done].copy()))
+            for env_i in envs[done]:
+                self.__reset_env(env_i)
+            observations = self.__format_outgoing_observations(envs[done])
+
+        return observations, rewards, dones, infos
+
+    def close(self):
+        self._template.close()
+
+    def __reset_env(self, env_i):
+        template = self._template
+
+        # Generate the initial state with the env's own random stream
+        template.np_random = self._np_randoms[env_i]
+        template._reset_state()
+
+        self._agents_grid[env_i] = template._agents_grid
+        self._foodpiles_grid[env_i] = template._foodpiles_grid
+        self._colonies_grid[env_i] = template._colonies_grid
+        self._pheromones_tag_grid[env_i] = template._pheromones_tag_grid
+        self.pheromones_in_grid[env_i] = 0
+        self.heat_map[env_i] = 0
+
+        self.agent_pos[env_i] = template.agent_pos
+        self.has_food[env_i] = 0
+        self.foodpile_pos[env_i] = template.foodpile_pos
+        self.foodpile_capacity[env_i] = [template.foodpile_capacity[foodpile_i] for foodpile_i in range(self.n_foodpiles)]
+        self.foodpile_depleted[env_i] = False
+        self.colonies_pos[env_i] = template.colonies_pos
+        self.colonies_storage[env_i] = template.initial_colonies_storage
+
+        self._step_count[env_i] = 0
+        self._total_episode_reward[env_i] = 0
+
+    def __evaporate_pheromones(self):
+        rate = self._template.pheromone_evaporation_rate
+
+        active = self.pheromones_in_grid > 0
+        self.pheromones_in_grid[active] -= rate
+
+        evaporated = active & (self.pheromones_in_grid < rate)
+        self.pheromones_in_grid[evaporated] = 0
+        self._pheromones_tag_grid[evaporated & (self._agents_grid == 0)] = False
+
+    def __update_agent_pos(self, agent_i, move):
+        envs = self._env_ids
+
+        # Movement actions, which can only lay pheromones when carrying food
+        moving = MOVE_ACTIONS[move] & ~(PHEROMONE_ACTIONS[move] & (self.has_food[:, agent_i] == 0))
+        next_pos = self.agent_pos[:, agent_i] + MOVE_DELTAS[move]
+        moving &= self._is_cell_walkable(envs, next_pos)
+        if not moving.any():
+            return
+
+        moving_envs = envs[moving]
+        curr_pos, next_pos = self.agent_pos[moving, agent_i], next_pos[moving]
+
+        self._agents_grid[moving_envs, curr_pos[:, 0], curr_pos[:, 1]] = 0
+        self._pheromones_tag_grid[moving_envs, curr_pos[:, 0], curr_pos[:, 1]] = False
+
+        self.agent_pos[moving_envs, agent_i] = next_pos
+        self._agents_grid[moving_envs, next_pos[:, 0], next_pos[:, 1]] = agent_i + 1
+        self._pheromones_tag_grid[moving_envs, next_pos[:, 0], next_pos[:, 1]] = False
+
+        # Add pheromones to last location
+        laying = PHEROMONE_ACTIONS[move[moving]]
+        self._pheromones_tag_grid[moving_envs[laying], curr_pos[laying, 0], curr_pos[laying, 1]] = True
+        self.pheromones_in_grid[moving_envs[laying], curr_pos[laying, 0], curr_pos[laying, 1]] += self._template.food_pheromone_intensity
+
+    def _is_valid(self, pos):
+        return (0 <= pos[..., 0]) & (pos[..., 0] < self._grid_shape[0]) & (0 <= pos[..., 1]) & (pos[..., 1] < self._grid_shape[1])
+
+    def _is_cell_walkable(self, env_ids, pos):
+        rows = pos[..., 0].clip(0, self._grid_shape[0] - 1)
+        cols = pos[..., 1].clip(0, self._grid_shape[1] - 1)
+        occupied = (self._agents_grid[env_ids, rows, cols] != 0) | (self._foodpiles_grid[env_ids, rows, cols] != 0) | (self._colonies_grid[env_ids, rows, cols] != 0)
+        return self._is_valid(pos) & ~occupied
+
+    def _neighbour_agents_batch(self, positions):
+        # Ids of the agents adjacent to each position, in the same order as AntColonyEnv._neighbour_agents (-1 if there is none)
+        neighbours_pos = positions[:, :, None, :] + NEIGHBOUR_OFFSETS
+        rows = neighbours_pos[..., 0].clip(0, self._grid_shape[0] - 1)
+        cols = neighbours_pos[..., 1].clip(0, self._grid_shape[1] - 1)
+
+        neighbours = self._agents_grid[self._env_ids[:, None, None], rows, cols]
+        return np.where(self._is_valid(neighbours_pos), neighbours, 0).astype(int) - 1
+
+    def __format_outgoing_observations(self, env_ids=slice(None)):
+        # env_ids selects the environments to observe, a slice (all of them by default) avoids copying the state
+        template = self._template
+        mask_size = template._view_rows.size
+        _obs = self._outgoing_observations
+
+        # Lookup tables indexed by the grid layers (column 0 stands for "no entity in this cell")
+        foodpile_capacity_lookup = np.pad(self.foodpile_capacity[env_ids], ((0, 0), (1, 0)))
+        has_food_lookup = np.pad(self.has_food[env_ids], ((0, 0), (1, 0)))
+
+        # Flat index of every cell in every agent's view area (n_envs x n_agents x mask_size), as in AntColonyEnv.get_agent_obs
+        # only the cells inside the grid are read, so every layer is gathered with a single take and no padded copy
+        envs = self._env_ids[env_ids]
+        local_envs = np.arange(len(envs))[:, None, None]
+        view_rows = self.agent_pos[env_ids, :, 0:1] + (template._view_rows - template._view_padding[0][0])
+        view_cols = self.agent_pos[env_ids, :, 1:2] + (template._view_cols - template._view_padding[1][0])
+        in_grid = (view_rows >= 0) & (view_rows < self._grid_shape[0]) & (view_cols >= 0) & (view_cols < self._grid_shape[1])
+        cells = (envs[:, None, None] * self._grid_shape[0] + view_rows.clip(0, self._grid_shape[0] - 1)) * self._grid_shape[1] \
+            + view_cols.clip(0, self._grid_shape[1] - 1)
+        view = lambda layer: np.where(in_grid, layer.reshape(-1).take(cells), 0)
+
+        # agent pos (2), colony pos (2, 1 COLONY)
+        _obs[env_ids, :, :2] = self.agent_pos[env_ids, :, ::-1]
+        _obs[env_ids, :, 2:4] = self.colonies_pos[env_ids, -1:, ::-1]
+
+        # foodpiles (25), pheromones (25)
+        _obs[env_ids, :, 4:4 + mask_size] = foodpile_capacity_lookup[local_envs, view(self._foodpiles_grid)]
+        _obs[env_ids, :, 4 + mask_size:4 + 2 * mask_size] = np.where(view(self._pheromones_tag_grid), view(self.pheromones_in_grid), 0)
+
+        # colonies storage (1 per colony)
+        colonies_in_view = view(self._colonies_grid)
+        for colony_i in range(self.n_colonies):
+            in_view = (colonies_in_view == colony_i + 1).any(axis=2)
+            _obs[env_ids, :, 4 + 2 * mask_size + colony_i] = np.where(in_view, self.colonies_storage[env_ids, colony_i:colony_i + 1], 0)
+
+        # has food (1), other agents (25)
+        _obs[env_ids, :, 4 + 2 * mask_size + self.n_colonies] = self.has_food[env_ids]
+        _obs[env_ids, :, 5 + 2 * mask_size + self.n_colonies:] = has_food_lookup[local_envs, view(self._agents_grid)]
+
+        if self.copy_observations:
+            return _obs.copy()
+
+        return read_only_view(self._outgoing_observations) # overwritten by the next reset/step
+
+
+# Row/col displacement, whether the agent moves and whether it lays pheromones, for each action in ACTION_MEANING
+MOVE_DELTAS = np.array([[1, 0], [0, -1], [-1, 0], [0, 1], [0, 0], [1, 0], [0, -1], [-1, 0], [0, 1], [0, 0], [0, 0], [0, 0]])
+MOVE_ACTIONS = np.array([True, True, True, True, False, True, True, True, True, False, False, False])
+PHEROMONE_ACTIONS = np.array([False, False, False, False, False, True, True, True, True, False, False, False])
@@ -0,0 +1,176 @@
+import glob
+import json
+import os
+
+import numpy as np
+
+
+class TrajectoryLog:
+
+    """Appendable on-disk log of (observations, actions, rewards, dones) steps, for offline analysis and training
+    Steps are buffered in fixed-size chunks, each saved as one .npz file of columns once full. An index lists every
+    episode (team, episode number, seed, first step, length), so reading one back only loads the chunks it spans.
+    The env state at the end of an episode can be saved with it (one .npz file per episode), to verify replays against.
+    mode='w' creates a log, mode='a' appends to one and mode='r' opens one read-only
+    """
+
+    def __init__(self, path, mode='r', chunk_size=4096, compress=False):
+        self.path = path
+        self.mode = mode
+        self._cached_chunk = None, None
+
+        if mode == 'w':
+            os.makedirs(path, exist_ok=True)
+            for filename in glob.glob(os.path.join(path, 'chunk_*.npz')) + glob.glob(os.path.join(path, 'final_state_*.npz')):
+                os.remove(filename)
+            self.chunk_size, self.compress = chunk_size, compress
+            self.episodes = []
+            self.n_steps = 0
+            self.__write_index()
+        else:
+            with open(os.path.join(path, INDEX_FILE)) as index_file:
+                index = json.load(index_file)
+            self.chunk_size, self.compress = index['chunk_size'], index['compress']
+            self.episodes = index['episodes']
+            self.n_steps = index['n_steps']
+
+        # Steps of the chunk being filled (the last chunk on disk may be partial, it is reloaded to append to it)
+        self._buffer = {}
+        if mode == 'a' and self.n_steps % self.chunk_size:
+            self._buffer = {column: list(values) for column, values in self.__load_chunk(self.n_steps // self.chunk_size).items()}
+
+    def begin_episode(self, team, episode, seed=None):
+        # seed is the one the env was seeded with before its reset, so the episode can be replayed (see ActionReplay)
+        assert self.mode != 'r', "TrajectoryLog opened read-only."
+        self.episodes.append({'team': str(team), 'episode': int(episode), 'seed': None if seed is None else int(seed), 'start': self.n_steps, 'length': 0,
+                              'final_state': False})
+
+    def append(self, observations, actions, rewards, dones):
+        # One step of the current episode, arrays are copied
+        assert self.episodes and self.mode != 'r', "begin_episode has to be called first."
+        step = {'observations': observations, 'actions': actions, 'rewards': rewards, 'dones': dones}
+        for column, values in step.items():
+            self._buffer.setdefault(column, []).append(np.array(values))
+
+        self.n_steps += 1
+        self.episodes[-1]['length'] += 1
+        if self.n_steps % self.chunk_size == 0:
+            self.__write_chunk()
+
+    def end_episode(self, final_state):
+        # Saves the env.get_state() of the end of the current episode (returned by read_episode as 'final_state')
+        assert self.episodes and self.mode != 'r', "begin_episode has to be called first."
+        np.savez(self.__final_state_filename(len(self.episodes) - 1), **_flatten_state(final_state))
+        self.episodes[-1]['final_state'] = True
+
+    def append_episode(self, team, episode, observations, actions, rewards, dones, seed=None, final_state=None):
+        # A whole episode at once, every argument has one row per step
+        self.begin_episode(team, episode, seed)
+        for step in zip(observations, actions, rewards, dones):
+            self.append(*step)
+        if final_state is not None:
+            self.end_episode(final_state)
+
+    def flush(self):
+        # Saves the partial chunk and the index, so the log can be read (or appended to) as it is
+        if self.mode != 'r':
+            if self.n_steps % self.chunk_size:
+                self.__write_chunk()
+            self.__write_index()
+
+    def close(self):
+        self.flush()
+        self._buffer = {}
+
+    def find_episodes(self, team=None, episode=None):
+        # Index of the episodes of a team and/or with a given episode number
+        return [episode_i for episode_i, entry in enumerate(self.episodes)
+                if (team is None or entry['team'] == team) and (episode is None or entry['episode'] == episode)]
+
+    def teams(self):
+        return list(dict.fromkeys(entry['team'] for entry in self.episodes))
+
+    def read_episode(self, episode_i):
+        # Columns of the episode_i-th logged episode, each with one row per step (negative indices count from the last one)
+        episode_i = range(len(self.episodes))[episode_i]
+        entry = self.episodes[episode_i]
+        start, end = entry['start'], entry['start'] + entry['length']
+
+        parts = {}
+        for chunk_i in range(start // self.chunk_size, -(-end // self.chunk_size)):
+            chunk = self.__chunk(chunk_i)
+            chunk_start = chunk_i * self.chunk_size
+            for column, values in chunk.items():
+                parts.setdefault(column, []).append(values[max(start - chunk_start, 0):end - chunk_start])
+
+        episode = {column: np.concatenate(values) for column, values in parts.items()}
+        if entry.get('final_state'): # older logs have no final states
+            with np.load(self.__final_state_filename(episode_i)) as final_state:
+                episode['final_state'] = _unflatten_state({key: final_state[key] for key in final_state.files})
+        return episode
+
+    def __chunk(self, chunk_i):
+        # Steps that were not written yet come from the buffer
+        if self.mode != 'r' and chunk_i == self.n_steps // self.chunk_size:
+            return {column: np.array(values) for column, values in self._buffer.items()}
+
+        if self._cached_chunk[0] != chunk_i: # consecutive episodes often share a chunk
+            self._cached_chunk = chunk_i, self.__load_chunk(chunk_i)
+        return self._cached_chunk[1]
+
+    def __load_chunk(self, chunk_i):
+        with np.load(self.__chunk_filename(chunk_i)) as chunk:
+            return {column: chunk[column] for column in chunk.files}
+
+    def __write_chunk(self):
+        chunk_i = (self.n_steps - 1) // self.chunk_size
+        columns = {column: np.array(values) for column, values in self._buffer.items()}
+        (np.savez_compressed if self.compress else np.savez)(self.__chunk_filename(chunk_i), **columns)
+
+        if self._cached_chunk[0] == chunk_i:
+            self._cached_chunk = None, None
+        if self.n_steps % self.chunk_size == 0:
+            self._buffer = {}
+
+    def __write_index(self):
+        index = {'chunk_size': self.chunk_size, 'compress': self.compress, 'n_steps': self.n_steps, 'episodes': self.episodes}
+        with open(os.path.join(self.path, INDEX_FILE + '.tmp'), 'w') as index_file:
+            json.dump(index, index_file)
+        os.replace(os.path.join(self.path, INDEX_FILE + '.tmp'), os.path.join(self.path, INDEX_FILE)) # never left half written
+
+    def __chunk_filename(self, chunk_i):
+        return os.path.join(self.path, f'chunk_{chunk_i:06d}.npz')
+
+    def __final_state_filename(self, episode_i):
+        return os.path.join(self.path, f'final_state_{episode_i:06d}.npz')
+
+
+def _flatten_state(state):
+    # env.get_state() as plain arrays: tiled grids are made dense, tuples (sparse pheromones) are split in numbered keys and
+    # dicts (random generator state) are kept as JSON
+    arrays = {}
+    for key, value in state.items():
+        if isinstance(value, dict):
+            arrays[key + '.json'] = np.array(json.dumps(value))
+        elif isinstance(value, tuple):
+            arrays.update({f'{key}.{item_i}': item for item_i, item in enumerate(value)})
+        else:
+            arrays[key] = np.asarray(value)
+    return arrays
+
+
+def _unflatten_state(arrays):
+    state, items = {}, {}
+    for key, value in arrays.items():
+        name, _, suffix = key.partition('.')
+        if suffix == 'json':
+            state[name] = json.loads(str(value))
+        elif suffix:
+            items.setdefault(name, {})[int(suffix)] = value
+        else:
+            state[name] = value
+    state.update({name: tuple(values[item_i] for item_i in range(len(values))) for name, values in items.items()})
+    return state
+
+
+INDEX_FILE = 'index.json'
@@ -4,6 +4,8 @@ from typing import Optional, Sequence
 import numpy as np
 import matplotlib.pyplot as plt
 
+from aasma.artifact_writer import default_writer
+
 
 def z_table(confidence):
     """Hand-coded Z-Table
@@ -108,7 +110,7 @@ def plot_confidence_bar(names, means, std_devs, N, title, x_label, y_label, conf
         plt.yscale(yscale)
     plt.tight_layout()
     if filename is not None:
-        plt.savefig(filename)
+        default_writer().save_figure(plt.gcf(), filename) # PNG encoding and I/O happen in the background
     if show:
         plt.show()
     plt.close()
@@ -126,7 +128,7 @@ def plot_line_graph(results, N, title, x_label, y_label, show=False, filename=No
         plt.yscale(yscale)
     plt.tight_layout()
     if filename is not None:
-        plt.savefig(filename)
+        default_writer().save_figure(plt.gcf(), filename) # PNG encoding and I/O happen in the background
     if show:
         plt.show()
     plt.close()
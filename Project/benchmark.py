@@ -0,0 +1,183 @@
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from aasma.simplified_predator_prey import AntColonyEnv
+
+from single_reactive_agent import ReactiveAntAgent
+from single_deliberative_agent import DeliberativeAntAgent
+from single_random_agent import RandomAntAgent
+from single_role_agent import RoleAntAgent
+
+AGENTS = {
+    "Random": RandomAntAgent,
+    "Reactive": ReactiveAntAgent,
+    "Deliberative": DeliberativeAntAgent,
+    "Role": RoleAntAgent,
+}
+
+def latency_stats(latencies_ns: np.ndarray, total_s: float) -> dict:
+    # Calls per second over the whole measurement and latency percentiles (in microseconds) of single calls
+    latencies_us = latencies_ns / 1e3
+    return {
+        "calls": int(latencies_ns.size),
+        "per_sec": latencies_ns.size / total_s,
+        "mean_us": float(latencies_us.mean()),
+        "p50_us": float(np.percentile(latencies_us, 50)),
+        "p90_us": float(np.percentile(latencies_us, 90)),
+        "p99_us": float(np.percentile(latencies_us, 99)),
+    }
+
+def measure(function, prepare=None, min_time: float = 0.5, max_calls: int = 10000) -> dict:
+    # Times function() until min_time seconds were spent in it (or max_calls were made), prepare() runs untimed before each call
+    latencies = []
+    spent = 0
+    while spent < min_time * 1e9 and len(latencies) < max_calls:
+        if prepare is not None:
+            prepare()
+        start = time.perf_counter_ns()
+        function()
+        latencies.append(time.perf_counter_ns() - start)
+        spent += latencies[-1]
+
+    return latency_stats(np.array(latencies, dtype=float), spent / 1e9)
+
+def make_environment(grid: int, n_agents: int, n_foodpiles: int, render_backend: str) -> AntColonyEnv:
+    # Long episodes that do not end on their own, so steps are measured in the middle of an episode
+    environment = AntColonyEnv(grid_shape=(grid, grid), n_agents=n_agents, n_foodpiles=n_foodpiles, max_steps=10 ** 9,
+                               colonies_storage_decrement=0, pheromone_evaporation_rate=2, render_backend=render_backend)
+    environment.seed(0)
+    environment.reset()
+    return environment
+
+def bench_environment(grid: int, n_agents: int, n_foodpiles: int, opt) -> list:
+    environment = make_environment(grid, n_agents, n_foodpiles, opt.render_backend)
+    rng = np.random.default_rng(0)
+    random_actions = lambda: rng.integers(0, environment.action_space[0].n, n_agents)
+
+    results = [{"name": "env.reset", **measure(environment.reset, None, opt.min_time, opt.max_calls)}]
+
+    # Warm up (pheromones, foodpiles being carried...) before measuring the rest
+    environment.seed(0)
+    environment.reset()
+    for _ in range(opt.warmup):
+        environment.step(random_actions())
+
+    actions = [None]
+    def prepare_step():
+        actions[0] = random_actions()
+
+    observed_environment, features = environment.get_agent_obs().copy(), environment.simplified_features()
+    functions = {
+        "step": (lambda: environment.step(actions[0]), prepare_step),
+        "get_agent_obs": (environment.get_agent_obs, None),
+        "simplified_features": (environment.simplified_features, None),
+        "format_outgoing_observations": (lambda: environment.format_outgoing_observations(features, observed_environment), None),
+        "render": (lambda: environment.render(mode='rgb_array'), lambda: environment.step(random_actions())), # a new frame every call
+    }
+    for name, (function, prepare) in functions.items():
+        results.append({"name": f"env.{name}", **measure(function, prepare, opt.min_time, opt.max_calls)})
+
+    return [{**result, "grid": grid, "agents": n_agents, "foodpiles": n_foodpiles} for result in results]
+
+def bench_agents(grid: int, n_agents: int, n_foodpiles: int, opt) -> list:
+    # Every agent class plays a whole team, action() is timed on the observations of that team's own episode
+    results = []
+    for agent_name, agent_class in AGENTS.items():
+        environment = make_environment(grid, n_agents, n_foodpiles, opt.render_backend)
+        agents = [agent_class(agent_id=agent_id, n_agents=n_agents) for agent_id in range(n_agents)]
+        for agent_i, agent in enumerate(agents):
+            agent.seed(agent_i)
+
+        observations = environment.reset()
+        latencies, end_to_end = [], []
+        spent = 0
+        while spent < opt.min_time * 1e9 and len(end_to_end) < opt.max_calls:
+            start_step = time.perf_counter_ns()
+            for observation, agent in zip(observations, agents):
+                agent.see(observation)
+
+            actions = []
+            for agent in agents:
+                start = time.perf_counter_ns()
+                actions.append(agent.action())
+                latencies.append(time.perf_counter_ns() - start)
+
+            observations, _, terminals, _ = environment.step(actions)
+            end_to_end.append(time.perf_counter_ns() - start_step)
+            spent += end_to_end[-1]
+
+            if all(terminals):
+                observations = environment.reset()
+
+        latencies, end_to_end = np.array(latencies, dtype=float), np.array(end_to_end, dtype=float)
+        config = {"grid": grid, "agents": n_agents, "foodpiles": n_foodpiles}
+        results.append({"name": f"agent.{agent_name}.action", **config, **latency_stats(latencies, latencies.sum() / 1e9)})
+        results.append({"name": f"team.{agent_name}.step", **config, **latency_stats(end_to_end, spent / 1e9)}) # see + action + env.step
+
+    return results
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    # Benchmarks whose median latency got more than threshold (a fraction) slower than in the baseline
+    key = lambda result: (result["name"], result["grid"], result["agents"], result["foodpiles"])
+    baseline = {key(result): result for result in baseline}
+
+    regressions = []
+    for result in results:
+        base = baseline.get(key(result))
+        if base is not None and result["p50_us"] > base["p50_us"] * (1 + threshold):
+            regressions.append({"benchmark": key(result), "baseline_p50_us": base["p50_us"], "p50_us": result["p50_us"],
+                                "slowdown": result["p50_us"] / base["p50_us"] - 1})
+    return regressions
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--grid", type=int, nargs="+", default=[16, 64]) # side of the (square) grid
+    parser.add_argument("--agents", type=int, nargs="+", default=[4, 32])
+    parser.add_argument("--foodpiles", type=int, nargs="+", default=[4])
+    parser.add_argument("--only", choices=["env", "agents"], default=None) # run only one of the two groups of benchmarks
+    parser.add_argument("--render-backend", choices=["pil", "raster"], default="pil")
+    parser.add_argument("--warmup", type=int, default=50) # steps played before measuring
+    parser.add_argument("--min-time", type=float, default=0.5) # seconds spent in each measurement
+    parser.add_argument("--max-calls", type=int, default=10000)
+    parser.add_argument("--output", type=str, default=None) # JSON file to write the results to (printed otherwise)
+    parser.add_argument("--baseline", type=str, default=None) # JSON results of an earlier run to compare with
+    parser.add_argument("--threshold", type=float, default=0.1) # median latency increase flagged as a regression
+    opt = parser.parse_args()
+
+    results = []
+    for grid, n_agents, n_foodpiles in itertools.product(opt.grid, opt.agents, opt.foodpiles):
+        if opt.only != "agents":
+            results += bench_environment(grid, n_agents, n_foodpiles, opt)
+        if opt.only != "env":
+            results += bench_agents(grid, n_agents, n_foodpiles, opt)
+        print(f"grid {grid}, {n_agents} agents, {n_foodpiles} foodpiles done", file=sys.stderr)
+
+    report = {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "render_backend": opt.render_backend},
+        "results": results,
+    }
+
+    if opt.baseline is not None:
+        with open(opt.baseline) as baseline_file:
+            report["regressions"] = compare(results, json.load(baseline_file)["results"], opt.threshold)
+
+    if opt.output is not None:
+        with open(opt.output, "w") as output_file:
+            json.dump(report, output_file, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+    for regression in report.get("regressions", []):
+        print(f"REGRESSION {regression['benchmark']}: p50 {regression['baseline_p50_us']:.1f} -> {regression['p50_us']:.1f} us "
+              f"({100 * regression['slowdown']:+.0f}%)", file=sys.stderr)
+
+    sys.exit(1 if report.get("regressions") else 0)
@@ -1,11 +1,14 @@
 import argparse
 import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 import numpy as np
 from gym import Env
-from typing import Sequence
+from typing import Optional, Sequence
 
 from aasma.utils import compare_results_teams, compare_results_storage
-from aasma.simplified_predator_prey import AntColonyEnv
+from aasma.trajectory_log import TrajectoryLog
+from aasma.simplified_predator_prey import AntColonyEnv, LayoutCache
 
 from single_reactive_agent import ReactiveAntAgent
 from single_deliberative_agent import DeliberativeAntAgent
@@ -14,88 +17,39 @@ from single_role_agent import RoleAntAgent
 
 SEED_MULTIPLIER = 1 # CHANGE THIS IF YOU WANT TO TEST A DIFFERENT SET OF MAPS!
 
-def run_multi_agent(environment: Env, n_episodes: int, max_steps: int) -> np.ndarray:
-    results_colonies_storage = {"Random Team" : np.zeros(max_steps), 
-                                "Deliberative Team": np.zeros(max_steps), 
-                                "Reactive Team": np.zeros(max_steps), 
-                                "Hybrid Team": np.zeros(max_steps),
-                                "Role Team": np.zeros(max_steps)}
-
-    results_teams = {"Random Team" : np.zeros(n_episodes), 
-                    "Deliberative Team": np.zeros(n_episodes), 
-                    "Reactive Team": np.zeros(n_episodes), 
-                    "Hybrid Team": np.zeros(n_episodes),
-                    "Role Team": np.zeros(n_episodes)}
-    
-    for episode in range(n_episodes):
-        
-        teams = {
-
-            "Random Team": [
-                RandomAntAgent(agent_id=0, n_agents=4),
-                RandomAntAgent(agent_id=1, n_agents=4),
-                RandomAntAgent(agent_id=2, n_agents=4),
-                RandomAntAgent(agent_id=3, n_agents=4),
-            ],
-
-            "Deliberative Team": [
-                DeliberativeAntAgent(agent_id=0, n_agents=4),
-                DeliberativeAntAgent(agent_id=1, n_agents=4),
-                DeliberativeAntAgent(agent_id=2, n_agents=4),
-                DeliberativeAntAgent(agent_id=3, n_agents=4),
-            ],
-
-            "Reactive Team": [
-                ReactiveAntAgent(agent_id=0, n_agents=4),
-                ReactiveAntAgent(agent_id=1, n_agents=4),
-                ReactiveAntAgent(agent_id=2, n_agents=4),
-                ReactiveAntAgent(agent_id=3, n_agents=4),
-            ],
-
-            "Hybrid Team": [
-                ReactiveAntAgent(agent_id=0, n_agents=4),
-                ReactiveAntAgent(agent_id=1, n_agents=4),
-                DeliberativeAntAgent(agent_id=2, n_agents=4),
-                DeliberativeAntAgent(agent_id=3, n_agents=4),
-            ],
-            "Role Team": [
-                RoleAntAgent(agent_id=0, n_agents=4),
-                RoleAntAgent(agent_id=1, n_agents=4),
-                RoleAntAgent(agent_id=2, n_agents=4),
-                RoleAntAgent(agent_id=3, n_agents=4),
-            ]
-
-        }
-
-        print(f"Episode {episode}")
-
-        for team, agents in teams.items():
-            steps = 0
-            terminals = [False for _ in range(len(agents))]
-            environment.seed((episode + 1) * SEED_MULTIPLIER) # we use this seed so for each episode the map is equal for every team
-            observations = environment.reset()
-
-            while not all(terminals):
-                steps += 1
-                
-                for observations, agent in zip(observations, agents):
-                    agent.see(observations)
-
-                actions = [agent.action() for agent in agents]
-                
-                next_observations, rewards, terminals, info = environment.step(actions)
-
-                results_colonies_storage[team][steps - 1] += info['colony_storage']
-
-                #environment.render() # ENABLE/DISABLE THIS TO VIEW ENVIRONMENT
-                #time.sleep(opt.render_sleep_time)
-
-                observations = next_observations
-            
-            environment.draw_heat_map(episode, team)
-            environment.close()
+TEAMS = {
+    "Random Team": [RandomAntAgent, RandomAntAgent, RandomAntAgent, RandomAntAgent],
+    "Deliberative Team": [DeliberativeAntAgent, DeliberativeAntAgent, DeliberativeAntAgent, DeliberativeAntAgent],
+    "Reactive Team": [ReactiveAntAgent, ReactiveAntAgent, ReactiveAntAgent, ReactiveAntAgent],
+    "Hybrid Team": [ReactiveAntAgent, ReactiveAntAgent, DeliberativeAntAgent, DeliberativeAntAgent],
+    "Role Team": [RoleAntAgent, RoleAntAgent, RoleAntAgent, RoleAntAgent],
+}
+
+def run_multi_agent(environment: Env, n_episodes: int, max_steps: int, n_workers: int = 1, trajectory_log: Optional[TrajectoryLog] = None) -> np.ndarray:
+    results_colonies_storage = {team: np.zeros(max_steps) for team in TEAMS}
+    results_teams = {team: np.zeros(n_episodes) for team in TEAMS}
+
+    jobs = [(team, episode) for episode in range(n_episodes) for team in TEAMS]
+
+    # Each worker process evaluates (team, episode) jobs on its own copy of the environment (shut down even if a job fails)
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(environment, )) if n_workers > 1 else nullcontext() as executor:
+        if executor is not None:
+            results_jobs = executor.map(_run_worker_job, jobs, [max_steps] * len(jobs), [trajectory_log is not None] * len(jobs), chunksize=max(1, len(jobs) // (4 * n_workers)))
+        else:
+            results_jobs = (run_team_episode(environment, team, episode, max_steps, trajectory_log is not None) for team, episode in jobs)
+
+        # Results come in job order, so parallel runs add them up exactly like serial ones
+        for (team, episode), (steps, colonies_storage, trajectory) in zip(jobs, results_jobs):
+            if team == next(iter(TEAMS)): print(f"Episode {episode}")
+
+            if trajectory_log is not None:
+                trajectory_log.append_episode(team, episode, *trajectory[:4], seed=episode_seed(episode), final_state=trajectory[4])
 
             results_teams[team][episode] = steps
+            results_colonies_storage[team] += colonies_storage
+
+    if trajectory_log is not None:
+        trajectory_log.flush()
 
     for team in results_colonies_storage.keys():
          for i in range(max_steps):
@@ -105,6 +59,70 @@ def run_multi_agent(environment: Env, n_episodes: int, max_steps: int) -> np.nda
 
     return results_final
 
+def episode_seed(episode: int) -> int:
+    return (episode + 1) * SEED_MULTIPLIER
+
+def run_team_episode(environment: Env, team: str, episode: int, max_steps: int, record_trajectory: bool = False, view_radius: Optional[int] = None):
+    # The agents see as far as the environment shows them unless told otherwise
+    view_radius = environment.unwrapped.view_radius if view_radius is None else view_radius
+    agents = [agent_class(agent_id=agent_id, n_agents=len(TEAMS[team]), view_radius=view_radius) for agent_id, agent_class in enumerate(TEAMS[team])]
+    colonies_storage = np.zeros(max_steps)
+    trajectory = ([], [], [], []) if record_trajectory else None # observations, actions, rewards, dones of every step (+ final state)
+
+    # We use this seed so for each episode the map is equal for every team (generated once with a layout cache)
+    # The agents get their own streams spawned from it, so every job is reproducible on its own
+    seed = episode_seed(episode)
+    environment.seed(seed)
+    for agent, agent_seed in zip(agents, np.random.SeedSequence(seed).spawn(len(agents))):
+        agent.seed(agent_seed)
+
+    steps = 0
+    terminals = [False for _ in range(len(agents))]
+    observations = environment.reset()
+
+    while not all(terminals):
+        steps += 1
+        
+        if record_trajectory:
+            trajectory[0].append(np.array(observations)) # copied, the env reuses its observation buffer
+
+        for observations, agent in zip(observations, agents):
+            agent.see(observations)
+
+        actions = [agent.action() for agent in agents]
+        
+        next_observations, rewards, terminals, info = environment.step(actions)
+
+        if record_trajectory:
+            for column, values in zip(trajectory[1:], (actions, rewards, terminals)):
+                column.append(values)
+
+        colonies_storage[steps - 1] += info['colony_storage']
+
+        #environment.render() # ENABLE/DISABLE THIS TO VIEW ENVIRONMENT
+        #time.sleep(opt.render_sleep_time)
+
+        observations = next_observations
+
+    if record_trajectory:
+        trajectory += (environment.unwrapped.get_state(), ) # replays of the episode are verified against it
+    
+    environment.draw_heat_map(episode, team)
+    environment.close()
+
+    return steps, colonies_storage, trajectory
+
+# Environment of each worker process (set once when the worker starts)
+_worker_environment = None
+
+def _init_worker(environment: Env):
+    global _worker_environment
+    _worker_environment = environment
+
+def _run_worker_job(job, max_steps, record_trajectory):
+    team, episode = job
+    return run_team_episode(_worker_environment, team, episode, max_steps, record_trajectory)
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
@@ -112,13 +130,18 @@ if __name__ == '__main__':
     parser.add_argument("--episodes", type=int, default=100) # CHANGE THIS (n_episodes)
     parser.add_argument("--steps", type=int, default=100) # CHANGE THIS (max_steps)
     parser.add_argument("--render-sleep-time", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=1) # number of processes evaluating episodes in parallel
+    parser.add_argument("--trajectories", type=str, default=None) # directory to log every step of every episode to
+    parser.add_argument("--view-radius", type=int, default=2) # cells the ants see around them (2 gives a 5x5 view)
     opt = parser.parse_args()# Autonomous Agents & Multi-Agent Systems
 
     # 1 - Setup the environment
-    environment = AntColonyEnv(grid_shape=(16, 16), n_agents=4, max_steps=opt.steps, n_foodpiles=4, n_episodes=opt.episodes, pheromone_evaporation_rate=2)
+    environment = AntColonyEnv(grid_shape=(16, 16), n_agents=4, max_steps=opt.steps, n_foodpiles=4, n_episodes=opt.episodes, pheromone_evaporation_rate=2,
+                               view_radius=opt.view_radius, layout_cache=LayoutCache())
 
     # 3 - Evaluate teams
-    results = run_multi_agent(environment, opt.episodes, opt.steps)
+    trajectory_log = TrajectoryLog(opt.trajectories, mode='w') if opt.trajectories is not None else None
+    results = run_multi_agent(environment, opt.episodes, opt.steps, n_workers=opt.workers, trajectory_log=trajectory_log)
 
     # 4 - Compare results
     compare_results_teams(
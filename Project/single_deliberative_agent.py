@@ -1,5 +1,4 @@
 import math
-import random
 import time
 import argparse
 import numpy as np
@@ -65,8 +64,8 @@ class DeliberativeAntAgent(AntAgent):
     The deliberative agent has beliefs, desires and intention
     """
 
-    def __init__(self, agent_id, n_agents, knowledgeable=True):
-        super(DeliberativeAntAgent, self).__init__(f"Deliberative Ant Agent", agent_id, n_agents, knowledgeable=True)
+    def __init__(self, agent_id, n_agents, knowledgeable=True, view_radius=2):
+        super(DeliberativeAntAgent, self).__init__(f"Deliberative Ant Agent", agent_id, n_agents, knowledgeable=True, view_radius=view_radius)
         
         # Deliberation variables
         self.desire = None
@@ -181,10 +180,10 @@ class DeliberativeAntAgent(AntAgent):
         if(abs_distances[0] + abs_distances[1] == 1 or (abs_distances[0] == 1 and abs_distances[1] == 1)):
             promising_pheromone_relative_index = self.find_relative_index(agent_position, self.promising_pheromone_pos)
 
-            surrounding_pheromone_down = pheromones_in_view[promising_pheromone_relative_index + 5]
-            surrounding_pheromone_left = pheromones_in_view[promising_pheromone_relative_index - 1]
-            surrounding_pheromone_up = pheromones_in_view[promising_pheromone_relative_index - 5]
-            surrounding_pheromone_right = pheromones_in_view[promising_pheromone_relative_index + 1]
+            surrounding_pheromone_down = pheromones_in_view[promising_pheromone_relative_index + self.view.down]
+            surrounding_pheromone_left = pheromones_in_view[promising_pheromone_relative_index + self.view.left]
+            surrounding_pheromone_up = pheromones_in_view[promising_pheromone_relative_index + self.view.up]
+            surrounding_pheromone_right = pheromones_in_view[promising_pheromone_relative_index + self.view.right]
 
             surrounding_pheromones = np.array([surrounding_pheromone_down, surrounding_pheromone_left, surrounding_pheromone_up, surrounding_pheromone_right])
             next_promising_pheromone = np.argmax(surrounding_pheromones)
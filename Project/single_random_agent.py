@@ -46,11 +46,11 @@ def run_single_agent(environment: Env, n_episodes: int) -> np.ndarray:
 
 class RandomAntAgent(AntAgent):
 
-    def __init__(self, agent_id, n_agents, knowledgeable=True):
-        super(RandomAntAgent, self).__init__(f"Random Ant Agent", agent_id, n_agents, knowledgeable)
+    def __init__(self, agent_id, n_agents, knowledgeable=True, view_radius=2):
+        super(RandomAntAgent, self).__init__(f"Random Ant Agent", agent_id, n_agents, knowledgeable, view_radius)
 
     def action(self) -> int:
-        return np.random.randint(self.n_actions)
+        return self.random_integer(0, self.n_actions - 1)
 
 if __name__ == '__main__':
 
@@ -1,5 +1,4 @@
 import math
-import random
 import time
 import argparse
 import numpy as np
@@ -49,8 +48,8 @@ def run_single_agent(environment: Env, n_episodes: int) -> np.ndarray:
     return results
 
 class ReactiveAntAgent(AntAgent):
-    def __init__(self, agent_id, n_agents, knowledgeable=True):
-        super(ReactiveAntAgent, self).__init__(f"Reactive Ant Agent", agent_id, n_agents, knowledgeable)
+    def __init__(self, agent_id, n_agents, knowledgeable=True, view_radius=2):
+        super(ReactiveAntAgent, self).__init__(f"Reactive Ant Agent", agent_id, n_agents, knowledgeable, view_radius)
 
     def action(self) -> int:
         '''TODO Unkowledgeable
@@ -142,10 +141,10 @@ class ReactiveAntAgent(AntAgent):
         if(abs_distances[0] + abs_distances[1] == 1 or (abs_distances[0] == 1 and abs_distances[1] == 1)):
             promising_pheromone_relative_index = self.find_relative_index(agent_position, self.promising_pheromone_pos)
 
-            surrounding_pheromone_down = pheromones_in_view[promising_pheromone_relative_index + 5]
-            surrounding_pheromone_left = pheromones_in_view[promising_pheromone_relative_index - 1]
-            surrounding_pheromone_up = pheromones_in_view[promising_pheromone_relative_index - 5]
-            surrounding_pheromone_right = pheromones_in_view[promising_pheromone_relative_index + 1]
+            surrounding_pheromone_down = pheromones_in_view[promising_pheromone_relative_index + self.view.down]
+            surrounding_pheromone_left = pheromones_in_view[promising_pheromone_relative_index + self.view.left]
+            surrounding_pheromone_up = pheromones_in_view[promising_pheromone_relative_index + self.view.up]
+            surrounding_pheromone_right = pheromones_in_view[promising_pheromone_relative_index + self.view.right]
 
             surrounding_pheromones = np.array([surrounding_pheromone_down, surrounding_pheromone_left, surrounding_pheromone_up, surrounding_pheromone_right])
             next_promising_pheromone = np.argmax(surrounding_pheromones)
@@ -181,10 +180,10 @@ class ReactiveAntAgent(AntAgent):
         if(abs_distances[0] + abs_distances[1] == 1 or (abs_distances[0] == 1 and abs_distances[1] == 1)):
             promising_pheromone_relative_index = self.find_relative_index(agent_position, self.promising_pheromone_pos)
 
-            surrounding_pheromone_down = pheromones_in_view[promising_pheromone_relative_index + 5]
-            surrounding_pheromone_left = pheromones_in_view[promising_pheromone_relative_index - 1]
-            surrounding_pheromone_up = pheromones_in_view[promising_pheromone_relative_index - 5]
-            surrounding_pheromone_right = pheromones_in_view[promising_pheromone_relative_index + 1]
+            surrounding_pheromone_down = pheromones_in_view[promising_pheromone_relative_index + self.view.down]
+            surrounding_pheromone_left = pheromones_in_view[promising_pheromone_relative_index + self.view.left]
+            surrounding_pheromone_up = pheromones_in_view[promising_pheromone_relative_index + self.view.up]
+            surrounding_pheromone_right = pheromones_in_view[promising_pheromone_relative_index + self.view.right]
 
             surrounding_pheromones = np.array([surrounding_pheromone_down, surrounding_pheromone_left, surrounding_pheromone_up, surrounding_pheromone_right])
             next_promising_pheromone = np.argmax(surrounding_pheromones)
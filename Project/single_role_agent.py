@@ -1,4 +1,3 @@
-import random
 import time
 import argparse
 import numpy as np
@@ -65,8 +64,8 @@ def run_single_agent(environment: Env, n_episodes: int) -> np.ndarray:
     return results
 
 class RoleAntAgent(DeliberativeAntAgent):
-    def __init__(self, agent_id, n_agents, knowledgeable=True, role_assign_period: int = 1):
-        super(RoleAntAgent, self).__init__(f"Role-based Agent", agent_id, n_agents)
+    def __init__(self, agent_id, n_agents, knowledgeable=True, role_assign_period: int = 1, view_radius=2):
+        super(RoleAntAgent, self).__init__(f"Role-based Agent", agent_id, n_agents, view_radius=view_radius)
         self.roles = ROLES
         self.role_assign_period = role_assign_period
         self.curr_role = None
@@ -218,9 +217,9 @@ class RoleAntAgent(DeliberativeAntAgent):
 
         agent_position = self.observation[:2]
 
-        foodpiles_in_view = self.observation[4:29]
+        foodpiles_in_view = self.observation[self.view.foodpiles]
 
-        other_agents_in_view = self.observation[56:]
+        other_agents_in_view = self.observation[self.view.other_agents]
 
         role_assignment = []
 
@@ -239,17 +238,11 @@ class RoleAntAgent(DeliberativeAntAgent):
     def closest_carrying_food_ant(self, agent_position, other_agents_in_view):
             #other_agents_in_view_final = del other_agents_in_view[0]
             other_agents_in_view_copy = np.copy(other_agents_in_view)
-            other_agents_in_view_copy[12] = 0
+            other_agents_in_view_copy[self.view.center] = 0
             other_agents_indices = np.where(other_agents_in_view_copy == 2)[0] # gather for non null indices
 
             # Get corresponding positions in array format
-            other_agents_positions = np.zeros(len(other_agents_indices) * 2)
-
-
-            for other_agent_i in range(len(other_agents_indices)):
-                other_agent_i_position = self.find_global_pos(agent_position, other_agents_indices[other_agent_i])
-                other_agents_positions[other_agent_i * 2] = other_agent_i_position[0]
-                other_agents_positions[other_agent_i * 2 + 1] = other_agent_i_position[1]
+            other_agents_positions = self.find_global_positions(agent_position, other_agents_indices)
 
             # Check closest foodpile position and move there
             closest_other_agent_position = self.closest_point_of_interest(agent_position, other_agents_positions)
@@ -262,13 +255,7 @@ class RoleAntAgent(DeliberativeAntAgent):
         foodpiles_indices = np.where(foodpiles_in_view != 0)[0] # gather for non null indices
 
         # Get corresponding positions in array format
-        foodpiles_positions = np.zeros(len(foodpiles_indices) * 2)
-
-
-        for foodpile_i in range(len(foodpiles_indices)): 
-            foodpile_i_pos = self.find_global_pos(agent_position, foodpiles_indices[foodpile_i])
-            foodpiles_positions[foodpile_i * 2] = foodpile_i_pos[0]
-            foodpiles_positions[foodpile_i * 2 + 1] = foodpile_i_pos[1]
+        foodpiles_positions = self.find_global_positions(agent_position, foodpiles_indices)
 
         # Check closest foodpile position and move there
         closest_foodpile_position = self.closest_point_of_interest(agent_position, foodpiles_positions)
@@ -316,7 +303,7 @@ class RoleAntAgent(DeliberativeAntAgent):
         elif abs_distances[0] < abs_distances[1]:
             return self._close_vertically(distances, has_food, food_quantity)
         else:
-            roll = random.uniform(0, 1)
+            roll = self.random_uniform()
             return self._close_horizontally(distances, has_food, food_quantity) if roll > 0.5 else self._close_vertically(distances, has_food, food_quantity)
 
     # ############### #